@@ -0,0 +1,284 @@
+# fake_opennms.py
+
+# Local stand-in for the OpenNMS Resources and Measurements APIs, for benchmarks
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Metrics on each synthetic F5 virtual server
+METRICS = [
+    "vsClientBytesIn",
+    "vsClientBytesOut",
+    "vsClientPktsIn",
+    "vsClientPktsOut",
+    "vsClientCurConns",
+    "vsClientTotConns",
+]
+
+
+class FakeOpenNMS(ThreadingHTTPServer):
+    """HTTP server answering like OpenNMS for a set of F5 nodes
+
+    Node resources list VIPs as ltmVSStatName resources. Measurements are
+    generated from the resource, metric and timestamp, so the same point has
+    the same value however the time range is split into requests. The last
+    VIP of each node has no data, like one just added. Requests, bytes and
+    points sent so far are reported at /stats.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        vips: int = 100,
+        resolution: int = 300000,
+        nan_ratio: float = 0.05,
+        latency: float = 0.0,
+    ) -> None:
+        super().__init__(address, Handler)
+        self.vips = vips
+        self.resolution = resolution
+        self.nan_ratio = nan_ratio
+        self.latency = latency
+        self.stats = {"requests": 0, "bytes": 0, "points": 0}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as the OpenNMS API URL in settings"""
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/opennms/rest/"
+
+    def resources(self, node: str) -> dict:
+        """Build resources response for a node
+
+        Args:
+            node (str): Foreign source name and ID of node
+
+        Returns:
+            dict: Node with one ltmVSStatName resource for each VIP
+        """
+        label = node.replace(":", "-")
+        children = [
+            {
+                "id": f"node[{node}].nodeSnmp[]",
+                "label": "Node-level Performance Data",
+                "stringPropertyAttributes": {},
+                "rrdGraphAttributes": {},
+            }
+        ]
+        for vip in range(0, self.vips):
+            name = f"{label}-vip{vip}"
+            children.append(
+                {
+                    "id": f"node[{node}].ltmVSStatName[{name}]",
+                    "label": f"/Common/{name}",
+                    "name": name,
+                    "stringPropertyAttributes": {"ltmVSStatName": f"/Common/{name}"},
+                    "rrdGraphAttributes": {
+                        metric: {"name": metric, "rrdFile": f"{metric}.jrb"}
+                        for metric in METRICS
+                    },
+                }
+            )
+        return {
+            "id": f"node[{node}]",
+            "label": f"10.0.0.1 ({label})",
+            "name": label,
+            "children": {"resource": children},
+        }
+
+    def series(self, resource: str, metric: str, timestamps: np.ndarray) -> str:
+        """Generate values for a source as JSON array contents
+
+        Args:
+            resource (str): Resource ID
+            metric (str): Metric name
+            timestamps (np.ndarray): Timestamps in milliseconds
+
+        Returns:
+            str: Comma separated values, with "NaN" for gaps
+        """
+        if resource.endswith(f"-vip{self.vips - 1}]"):
+            return ",".join(['"NaN"'] * len(timestamps))
+        seed = zlib.crc32(f"{resource}/{metric}".encode()) / 2**32
+        hours = timestamps / 3600000
+        # Daily cycle, scaled per source, with noise from the timestamp
+        noise = np.modf(np.sin(hours * 12.9898 + seed * 78.233) * 43758.5453)[0]
+        values = (1.5 + np.sin(hours * np.pi / 12 + seed * 6)) * (seed + 0.1) * 1e6
+        values *= 1 + 0.2 * noise
+        text = np.char.mod("%.4f", values).astype(object)
+        text[np.abs(noise) < self.nan_ratio] = '"NaN"'
+        return ",".join(text.tolist())
+
+    def measurements(self, payload: dict) -> bytes:
+        """Build Measurements response for a query
+
+        Args:
+            payload (dict): Query posted to the Measurements API
+
+        Returns:
+            bytes: JSON response body
+        """
+        start, end = payload["start"], payload["end"]
+        if start < 0:
+            now = int(time.time() * 1000)
+            start, end = now + start, now + end
+        step = max(payload.get("step", 1), self.resolution)
+        first = -(-start // step) * step
+        timestamps = np.arange(first, end + 1, step, dtype=np.int64)
+        columns = []
+        # Like OpenNMS, one resource for each source column, in the same order
+        resources = []
+        for source in payload["source"]:
+            values = self.series(source["resourceId"], source["attribute"], timestamps)
+            columns.append('{"values":[' + values + "]}")
+            name = source["resourceId"].split("[")[-1].rstrip("]")
+            resources.append(
+                {
+                    "id": source["resourceId"],
+                    "label": f"/Common/{name}",
+                    "name": name,
+                }
+            )
+        with self.stats_lock:
+            self.stats["points"] += len(timestamps) * len(columns)
+        head = {
+            "step": step,
+            "start": start,
+            "end": end,
+            "labels": [source["label"] for source in payload["source"]],
+            "metadata": {"resources": resources, "nodes": []},
+        }
+        return (
+            json.dumps(head)[:-1]
+            + ',"timestamps":['
+            + ",".join(map(str, timestamps.tolist()))
+            + '],"columns":['
+            + ",".join(columns)
+            + "]}"
+        ).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler for FakeOpenNMS"""
+
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, body: bytes, status: int = 200):
+        """Send response after the configured latency
+
+        Args:
+            body (bytes): JSON response body
+            status (int, optional): HTTP status. Defaults to 200.
+        """
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+            self.server.stats["bytes"] += len(body)
+
+    def do_GET(self):
+        prefix = "/opennms/rest/resources/fornode/"
+        if self.path == "/stats":
+            with self.server.stats_lock:
+                stats = dict(self.server.stats)
+            self.send_json(json.dumps(stats).encode())
+            return
+        if not self.path.startswith(prefix):
+            self.send_json(b'{"error": "not found"}', 404)
+            return
+        node = self.path[len(prefix) :]
+        self.send_json(json.dumps(self.server.resources(node)).encode())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/opennms/rest/measurements":
+            self.send_json(b'{"error": "not found"}', 404)
+            return
+        self.send_json(self.server.measurements(json.loads(body)))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_process(
+    vips: int = 100,
+    resolution: int = 300,
+    nan_ratio: float = 0.05,
+    latency: float = 0.0,
+) -> tuple:
+    """Start fake OpenNMS server in its own process on a free port
+
+    Running apart from the code being measured keeps response generation
+    from competing with it for the interpreter.
+
+    Args:
+        vips (int, optional): VIPs on each node. Defaults to 100.
+        resolution (int, optional): Seconds between stored points.
+        Defaults to 300.
+        nan_ratio (float, optional): Share of values returned as NaN.
+        Defaults to 0.05.
+        latency (float, optional): Seconds added before each response.
+        Defaults to 0.0.
+
+    Returns:
+        tuple: Server process, stop with terminate(), and its API URL
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--port=0",
+            f"--vips={vips}",
+            f"--resolution={resolution}",
+            f"--nan-ratio={nan_ratio}",
+            f"--latency={latency}",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return process, process.stdout.readline().split()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake OpenNMS data")
+    parser.add_argument("--port", type=int, default=8980, help="Port to listen on")
+    parser.add_argument("--vips", type=int, default=100, help="VIPs on each node")
+    parser.add_argument(
+        "--resolution", type=int, default=300, help="Seconds between points"
+    )
+    parser.add_argument(
+        "--nan-ratio", type=float, default=0.05, help="Share of values missing"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to each response"
+    )
+    args = parser.parse_args()
+
+    server = FakeOpenNMS(
+        ("127.0.0.1", args.port),
+        args.vips,
+        args.resolution * 1000,
+        args.nan_ratio,
+        args.latency,
+    )
+    print(f"Serving fake OpenNMS at {server.url}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# pipeline.py
+
+# Time each stage of collecting and reporting a pair against a fake OpenNMS server
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+from PIL import Image
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(BENCHMARKS), "src")
+sys.path.insert(0, SRC)
+
+import discovery  # noqa: E402
+import export  # noqa: E402
+import packing  # noqa: E402
+import ra_processing  # noqa: E402
+import renderer  # noqa: E402
+import trending  # noqa: E402
+from fake_opennms import start_process  # noqa: E402
+
+
+def commit() -> str:
+    """Identify the version being measured
+
+    Returns:
+        str: Git commit of the repository, or None if unknown
+    """
+    result = subprocess.run(
+        ["git", "describe", "--always", "--dirty"],
+        cwd=BENCHMARKS,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or None
+
+
+class Stages:
+    """Seconds spent in each named stage"""
+
+    def __init__(self, quiet: bool = True) -> None:
+        self.seconds = {}
+        self.quiet = quiet
+
+    @contextlib.contextmanager
+    def time(self, name: str):
+        """Time a stage, hiding its console output unless verbose
+
+        Args:
+            name (str): Stage name
+        """
+        output = io.StringIO() if self.quiet else sys.stdout
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            yield
+        self.seconds[name] = time.perf_counter() - start
+
+
+def run(args: argparse.Namespace, url: str) -> dict:
+    """Collect and report a pair of nodes from the fake server
+
+    Args:
+        args (argparse.Namespace): Benchmark options
+        url (str): URL to fake OpenNMS API
+
+    Returns:
+        dict: Settings, counts and seconds for each stage
+    """
+    stages = Stages(quiet=not args.verbose)
+    pair = ["bench:node-a", "bench:node-b"]
+    data_end = int(time.time() * 1000)
+    data_start = data_end - args.days * 86400000
+
+    with stages.time("discover"):
+        found = {node: discovery.discover_node(url, None, node) for node in pair}
+        pair_name, interfaces, metrics = export.pair_details(pair, found)
+
+    marks = {}
+
+    def progress(status: dict):
+        if status["phase"] == "summarizing":
+            marks.setdefault("summarizing", time.perf_counter())
+
+    with stages.time("collect"):
+        start = time.perf_counter()
+        parsed_metrics = ra_processing.main(
+            url,
+            None,
+            interfaces,
+            metrics,
+            data_start,
+            data_end,
+            cache_days=0,
+            progress=progress,
+        )
+    # Collection ends by averaging values into each VIP's summaries
+    stages.seconds["summarize"] = stages.seconds["collect"] - (
+        marks["summarizing"] - start
+    )
+    stages.seconds["collect"] -= stages.seconds["summarize"]
+
+    with stages.time("packing"):
+        unpacked = {
+            interface: packing.unpack_entry(packing.pack_entry(entry))
+            for interface, entry in parsed_metrics.items()
+        }
+
+    with stages.time("summary_stats"):
+        ra_processing.summary_stats(parsed_metrics, "node[device]", metrics)
+    with stages.time("top_n_stats"):
+        ra_processing.top_n_stats(parsed_metrics)
+    with stages.time("top_n_stats_all"):
+        ra_processing.top_n_stats(parsed_metrics, 0)
+
+    vips = ra_processing.vip_names(parsed_metrics)
+    report = ["node[device]"] + ["/Common/" + vip for vip in vips[: args.report_vips]]
+    byte_metrics = trending.byte_metrics(metrics)
+    with stages.time("time_trend"):
+        trends = [
+            trending.time_trend(parsed_metrics, interface, byte_metrics)
+            for interface in report
+        ]
+    with stages.time("time_lines"):
+        lines = [
+            trending.time_lines(parsed_metrics, interface, byte_metrics)
+            for interface in report
+        ]
+        weekends = [
+            trending.find_weekends(parsed_metrics, interface) for interface in report
+        ]
+    with stages.time("graph_lines"):
+        graphs = [
+            trending.get_trend_line(*trending.downsample_lines(*line), weekend)
+            for line, weekend in zip(lines, weekends)
+        ]
+    checks = {
+        # Stored results come back exactly as collected
+        "packing": unpacked == parsed_metrics,
+        # Browser graphs of long lines use WebGL with the default settings
+        "webgl": all(
+            (graph.data[0].type == "scattergl")
+            == (max(len(line[0]["x"]), len(line[1]["x"])) > trending.WEBGL_POINTS)
+            for graph, line in zip(graphs, lines)
+        ),
+    }
+
+    with stages.time("figures"):
+        figures = []
+        for trend, line, weekend in zip(trends, lines, weekends):
+            figures.append(trending.get_trend_graph(trend, margin=10))
+            figures.append(
+                trending.get_trend_line(
+                    line[0], line[1], weekend, margin=10, webgl=False
+                )
+            )
+    # Start kaleido before timing, it is kept running between renders
+    renderer.render_png(figures[:1])
+    with stages.time("render"):
+        renderer.render_png(figures)
+    with stages.time("render_node_pdf"):
+        pdf = export.render_node_pdf(
+            pair_name, vips[: args.report_vips], parsed_metrics, byte_metrics
+        )
+        size = len(pdf.output())
+
+    stats = requests.get(url.split("/opennms/")[0] + "/stats").json()
+    return {
+        "commit": commit(),
+        "settings": {
+            "vips": args.vips,
+            "days": args.days,
+            "resolution": args.resolution,
+            "nan_ratio": args.nan_ratio,
+            "latency": args.latency,
+            "report_vips": args.report_vips,
+        },
+        "counts": {
+            "interfaces": len(interfaces),
+            "metrics": len(metrics),
+            "requests": stats["requests"],
+            "points": stats["points"],
+            "bytes": stats["bytes"],
+            "figures": len(figures),
+            "pdf_pages": pdf.page,
+            "pdf_bytes": size,
+        },
+        "stages": stages.seconds,
+        "checks": checks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the collection and report pipeline against fake data"
+    )
+    parser.add_argument("--vips", type=int, default=100, help="VIPs on each node")
+    parser.add_argument("--days", type=int, default=30, help="Days of data")
+    parser.add_argument(
+        "--resolution", type=int, default=300, help="Seconds between stored points"
+    )
+    parser.add_argument(
+        "--nan-ratio", type=float, default=0.05, help="Share of values missing"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to each response"
+    )
+    parser.add_argument(
+        "--report-vips", type=int, default=5, help="VIPs included in figures and PDF"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show console output")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as folder:
+        # PDF pages need logos, which are read from the working folder
+        os.makedirs(os.path.join(folder, "ra_config"))
+        for name in ["logo.png", "logo_customer.png"]:
+            Image.new("RGB", (200, 50), "white").save(
+                os.path.join(folder, "ra_config", name)
+            )
+        os.chdir(folder)
+        server, url = start_process(
+            args.vips, args.resolution, args.nan_ratio, args.latency
+        )
+        try:
+            results = run(args, url)
+        finally:
+            server.terminate()
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = [name for name, passed in results["checks"].items() if not passed]
+    if failed:
+        sys.exit(f"Failed checks: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
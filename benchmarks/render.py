@@ -0,0 +1,115 @@
+# render.py
+
+# Measure chart rendering throughput for PDFs, in figures per second
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import plotly.graph_objects as go
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+import export  # noqa: E402
+import renderer  # noqa: E402
+
+
+def sample_figures(count: int, points: int) -> list:
+    """Build line and heatmap charts like the ones on VIP pages
+
+    Args:
+        count (int): Figures to build
+        points (int): Points in each line chart
+
+    Returns:
+        list: Plotly figures
+    """
+    rng = np.random.default_rng(1)
+    figures = []
+    for i in range(0, count):
+        if i % 2:
+            figures.append(go.Figure(go.Heatmap(z=rng.random((25, 7)))))
+        else:
+            figures.append(
+                go.Figure(
+                    [go.Scatter(y=rng.random(points) * 1e6, mode="lines")]
+                    + [go.Scatter(y=rng.random(points) * 1e6, mode="lines")]
+                )
+            )
+    return figures
+
+
+def with_files(figures: list, folder: str) -> float:
+    """Render through PNG files, as PDFs were built before
+
+    Args:
+        figures (list): Plotly figures
+        folder (str): Folder for image files
+
+    Returns:
+        float: Seconds taken
+    """
+    pdf = export.PDF()
+    pdf.created = datetime.now()
+    start = time.perf_counter()
+    for i, figure in enumerate(figures):
+        path = os.path.join(folder, f"fig-{i}.png")
+        figure.write_image(
+            path, format="png", width=renderer.WIDTH, height=renderer.HEIGHT
+        )
+        pdf.add_page()
+        pdf.add_image(path, 10, 75)
+    return time.perf_counter() - start
+
+
+def in_memory(figures: list) -> float:
+    """Render to PNG bytes passed straight to the PDF
+
+    Args:
+        figures (list): Plotly figures
+
+    Returns:
+        float: Seconds taken
+    """
+    pdf = export.PDF()
+    pdf.created = datetime.now()
+    start = time.perf_counter()
+    for image in renderer.render_png(figures):
+        pdf.add_page()
+        pdf.add_image(io.BytesIO(image), 10, 75)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chart rendering speed")
+    parser.add_argument("--figures", type=int, default=20, help="Figures per run")
+    parser.add_argument("--points", type=int, default=8640, help="Points per line")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    figures = sample_figures(args.figures, args.points)
+    # Start kaleido before timing, it is kept running between renders
+    renderer.render_png(figures[:1])
+    with tempfile.TemporaryDirectory() as folder:
+        files = with_files(figures, folder)
+    memory = in_memory(figures)
+    results = {
+        "figures": args.figures,
+        "files_per_second": args.figures / files,
+        "memory_per_second": args.figures / memory,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# startup.py
+
+# Measure web worker startup: cold import of app.py and first request latency
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Runs in a fresh interpreter inside src/, like a gunicorn worker
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.web.test_client()
+status = client.get("/").status_code
+first = time.perf_counter()
+import export, trending
+heavy = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "first_request": first - imported,
+    "first_request_status": status,
+    "deferred_imports": heavy - first,
+}))
+"""
+
+
+def run_probe() -> dict:
+    """Start a new interpreter and time app startup
+
+    Returns:
+        dict: Seconds for import, first request and deferred imports
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure web app startup time")
+    parser.add_argument("--runs", type=int, default=5, help="Startups to measure")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    results = {"runs": runs}
+    for key in ["import", "first_request", "deferred_imports"]:
+        results[key] = {
+            "median": statistics.median(run[key] for run in runs),
+            "max": max(run[key] for run in runs),
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# tables.py
+
+# Measure TopN table drawing for PDFs, in pages per second
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from fpdf import HTMLMixin
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+import export  # noqa: E402
+
+
+class HTMLPDF(export.PDF, HTMLMixin):
+    """PDF drawing tables through HTML, as PDFs were built before"""
+
+    def top_n_summary(self, pair_name: str, parsed_metrics: dict, x: float, y: float):
+        top_n = parsed_metrics["node[top_n]"]
+        self.set_font("Helvetica", size=10)
+        for metric in top_n:
+            self.template_page(pair_name, f"Top VIPs: {metric}")
+            table_html = '<table width="100%">'
+            table_html += "<tr>"
+            table_html += '<th width="34%">VIP</th>'
+            table_html += f'<th width="33%">Average {metric}</th>'
+            table_html += f'<th width="33%">Peak {metric}</th>'
+            table_html += "</tr>"
+            for site in top_n[metric]:
+                table_html += "<tr>"
+                table_html += f'<td>{site.rsplit("/", 1)[1]}</td>'
+                table_html += f'<td align="right"><font face="Courier">{export.numberFormat(top_n[metric][site])}</font></td>'
+                table_html += '<td align="right"><font face="Courier">'
+                table_html += f'{export.numberFormat(parsed_metrics[site]["stats"][metric]["Max"])}</font></td>'
+                table_html += "</tr>"
+            table_html += "<tr><td> </td><td> </td></tr>"
+            table_html += "</table>"
+            self.write_html(table_html)
+
+
+def sample_metrics(vips: int, metrics: int) -> dict:
+    """Build TopN rankings like the ones in parsed metrics
+
+    Args:
+        vips (int): VIPs ranked for each metric
+        metrics (int): Metrics ranked
+
+    Returns:
+        dict: Parsed metrics with TopN rankings and VIP stats
+    """
+    names = [f"metric{i}" for i in range(0, metrics)]
+    sites = [f"/Common/vip-{i}.example.com" for i in range(0, vips)]
+    parsed_metrics = {
+        "node[top_n]": {
+            metric: {site: (vips - i) * 1234.5678 for i, site in enumerate(sites)}
+            for metric in names
+        }
+    }
+    for site in sites:
+        parsed_metrics[site] = {
+            "stats": {metric: {"Max": 98765.4321} for metric in names}
+        }
+    return parsed_metrics
+
+
+def build(pdf_class, parsed_metrics: dict) -> tuple:
+    """Draw TopN pages and write the PDF
+
+    Args:
+        pdf_class (type): PDF class to draw tables with
+        parsed_metrics (dict): Parsed metrics with TopN rankings
+
+    Returns:
+        tuple: Pages written and seconds taken
+    """
+    pdf = pdf_class()
+    pdf.created = datetime.now()
+
+    # Pages are added without logos, so only tables are measured
+    def template_page(pair_name: str, page_name: str):
+        pdf.add_page()
+        pdf.titles(page_name)
+
+    pdf.template_page = template_page
+    start = time.perf_counter()
+    pdf.top_n_summary("benchmark", parsed_metrics, 10, 29)
+    pdf.output()
+    return pdf.page, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure PDF table drawing speed")
+    parser.add_argument("--vips", type=int, default=5000, help="VIPs per table")
+    parser.add_argument("--metrics", type=int, default=4, help="Tables drawn")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    parsed_metrics = sample_metrics(args.vips, args.metrics)
+    html_pages, html = build(HTMLPDF, parsed_metrics)
+    native_pages, native = build(export.PDF, parsed_metrics)
+    results = {
+        "vips": args.vips,
+        "metrics": args.metrics,
+        "html_pages": html_pages,
+        "html_pages_per_second": html_pages / html,
+        "native_pages": native_pages,
+        "native_pages_per_second": native_pages / native,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,26 +5,35 @@
 import base64
 import json
 import os
+import threading
 import time
 from datetime import datetime
 from os.path import exists
 
-import plotly
 from flask import (
     Flask,
+    abort,
     flash,
+    g,
+    jsonify,
     make_response,
     redirect,
     render_template,
     request,
+    send_file,
     session,
     url_for,
 )
 from requests.auth import HTTPBasicAuth
 
-import export
+# Plotting and PDF modules (export, renderer, trending, plotly) are imported by the pages
+# that use them, so web workers start without loading them
+import discovery
+import jobs
+import memory
 import ra_processing
-import trending
+import result_cache
+import spans
 from flask_session import Session
 
 web = Flask(__name__)
@@ -55,18 +64,42 @@ def clear_temp(session: bool = False):
 clear_temp(session=False)
 
 
-def get_pair_list() -> None:
-    """Get names of pairs from OpenNMS instance"""
+def pair_names(found: dict) -> list:
+    """Build pair names from discovered nodes
+
+    Args:
+        found (dict): Resources for each node in config
+
+    Returns:
+        list: Node labels for each pair
+    """
     pairs = [list(i) for i in web.my_config["nodes"]]
     for i in range(0, len(pairs)):
         for node in range(0, len(pairs[i])):
-            interfaces = ra_processing.get_interfaces(
-                web.my_config["url"],
-                HTTPBasicAuth(web.my_config["username"], web.my_config["password"]),
-                pairs[i][node],
-            )
-            pairs[i][node] = interfaces["label"].split(" ")[1][1:-1]
-    web.pair_list = list(pairs)
+            pairs[i][node] = found[pairs[i][node]]["label"].split(" ")[1][1:-1]
+    return pairs
+
+
+def get_pair_list() -> None:
+    """Get names of pairs from OpenNMS instance"""
+    found = web.discovery.discover(
+        web.my_config["url"],
+        HTTPBasicAuth(web.my_config["username"], web.my_config["password"]),
+        [node for pair in web.my_config["nodes"] for node in pair],
+    )
+    web.pair_list = pair_names(found)
+
+
+def warm_pair_list():
+    """Use cached pair names, even if expired, and refresh them in background"""
+    nodes = [node for pair in web.my_config["nodes"] for node in pair]
+    cached = web.discovery.load(web.my_config["url"], nodes, stale=True)
+    if all(node in cached for node in nodes):
+        web.pair_list = pair_names(cached)
+    web.pair_warmup = threading.Thread(
+        target=get_pair_list, name="pair-warmup", daemon=True
+    )
+    web.pair_warmup.start()
 
 
 def update_settings(settings: dict = {}):
@@ -105,17 +138,24 @@ def update_settings(settings: dict = {}):
         if type(new_settings["nodes"]) == str:
             new_settings["nodes"] = json.loads(new_settings["nodes"])
             new_settings["nodes"] = sorted(new_settings["nodes"])
+    ra_processing.configure_client(**ra_processing.client_options(new_settings))
+    web.my_config = new_settings
+    web.results = result_cache.open_cache(new_settings)
+    web.discovery = discovery.open_cache(new_settings)
     if update:
         f = open("ra_config/config.json", "w")
         json.dump(new_settings, f)
         f.close()
         flash("Settings Updated")
+        web.discovery.invalidate()
         get_pair_list()
-    web.my_config = new_settings
 
 
 update_settings()
-get_pair_list()
+warm_pair_list()
+web.jobs = jobs.JobStore()
+spans.share()
+web.pdf_jobs = jobs.JobStore(workers=jobs.PDF_WORKERS)
 
 
 @web.errorhandler(404)
@@ -138,6 +178,11 @@ def page_not_found(e):  # noqa: W0404
     return render_template("error.html", error=e), 500
 
 
+@web.errorhandler(result_cache.ResultExpired)
+def result_expired(e):
+    return reload_results()
+
+
 @web.template_filter()
 def numberFormat(value: float, round: int = 2) -> str:
     """Formats numbers with commas and decimals
@@ -158,30 +203,121 @@ def global_vars():
     vars = {
         "og_title": "OpenNMS Auxiliary Reports",
         "og_description": "Custom trending and reporting for OpenNMS",
+        "vips": session_vips,
     }
     return vars
 
 
-def get_data(redirect: redirect) -> dict:
+def get_data(
+    config: dict, pair: list, start_date: int, end_date: int, progress=None
+) -> dict:
     """Get data from remote OpenNMS instance
 
+    Runs as a background job, so session values are returned instead of set.
+
     Args:
-        redirect (redirect): URL to redirect user after retrieving data.
+        config (dict): Application settings
+        pair (list): Foreign source and ID of nodes in the pair
+        start_date (int): Timestamp for start of data, None for default range
+        end_date (int): Timestamp for end of data, None for default range
+        progress (function, optional): Callback for collection progress.
+        Defaults to None.
 
     Returns:
-        dict: Data from remote OpenNMS instance
-    """ """"""
-    RA_url = web.my_config["url"]
-    RAauth = HTTPBasicAuth(web.my_config["username"], web.my_config["password"])
+        dict: Session values for the collected pair
+    """
+    RA_url = config["url"]
+    RAauth = HTTPBasicAuth(config["username"], config["password"])
 
     interfaces = []
     metrics = []
+    nodes = {}
+    found = web.discovery.discover(RA_url, RAauth, pair)
+    for node in pair:
+        nodes[node] = {
+            "label": found[node]["label"],
+            "name": found[node]["name"],
+        }
+        nodes[node]["ip"] = nodes[node]["label"].split(" ")[0]
+        nodes[node]["label"] = nodes[node]["label"].split(" ")[1][1:-1]
+        interfaces_a, metrics_a = found[node]["interfaces"], found[node]["metrics"]
+        [
+            interfaces.append(interface)
+            for interface in interfaces_a
+            if interface not in interfaces
+        ]
+        [metrics.append(metric) for metric in metrics_a if metric not in metrics]
+
+    key = result_cache.result_key(config, pair, start_date, end_date, metrics)
+    parsed_metrics = web.results.load(key)
+    if parsed_metrics is None:
+        profile = memory.open_profile(
+            config, ":".join([nodes[node]["label"] for node in nodes])
+        )
+        try:
+            parsed_metrics = ra_processing.main(
+                base_url=RA_url,
+                auth=RAauth,
+                interfaces=interfaces,
+                metric_labels=metrics,
+                data_start=start_date,
+                data_end=end_date,
+                progress=progress,
+                profile=profile,
+                **ra_processing.collection_options(config),
+            )
+            web.results.save(key, parsed_metrics, progress)
+        finally:
+            # Stops tracing even if collection failed
+            if profile:
+                profile.finish(len(interfaces))
+
+    return {
+        "pair": {
+            "nodes": nodes,
+            "name": ":".join([nodes[node]["label"] for node in nodes]),
+        },
+        "metrics": metrics,
+        "result": key,
+    }
+
+
+def get_results() -> dict:
+    """Get collected data for the user's pair from the shared result cache
+
+    Returns:
+        dict: Parsed metrics, or None if not collected or expired
+    """
+    if "result" not in session:
+        return None
+    if "results" not in g:
+        g.results = web.results.load(session["result"], shared=False)
+    return g.results
+
+
+def session_vips() -> list:
+    """List VIPs of the user's pair, from its collected data
+
+    Returns:
+        list: VIP names, empty if not collected or expired
+    """
+    parsed_metrics = get_results()
+    if parsed_metrics is None:
+        return []
+    return ra_processing.vip_names(parsed_metrics)
+
+
+def session_range() -> tuple:
+    """Get pair and date range selected by the user
+
+    Returns:
+        tuple: Nodes in the pair, and start and end timestamps of data,
+        None for the default range
+    """
     epoch = datetime.utcfromtimestamp(0)
     if not session.get("new_pair"):
         session["new_pair"] = 0
-    if not session.get("pair"):
-        session["pair"] = {"nodes": {}}
-    pair = [label for label in session["pair"]["nodes"]]
+    pair = [label for label in session.get("pair", {}).get("nodes", {})]
     if not pair:
         pair = web.my_config["nodes"][session["new_pair"]]
     if session.get("start_date"):
@@ -192,47 +328,20 @@ def get_data(redirect: redirect) -> dict:
         end_date = int((session["end_date"] - epoch).total_seconds()) * 1000
     else:
         end_date = None
+    return pair, start_date, end_date
 
-    for node in pair:
-        interface_list = ra_processing.get_interfaces(RA_url, RAauth, node)
-        session["pair"]["nodes"][node] = {
-            "label": interface_list["label"],
-            "name": interface_list["name"],
-        }
-        session["pair"]["nodes"][node]["ip"] = session["pair"]["nodes"][node][
-            "label"
-        ].split(" ")[0]
-        session["pair"]["nodes"][node]["label"] = session["pair"]["nodes"][node][
-            "label"
-        ].split(" ")[1][1:-1]
-        # node_list = [interface_list['label']]
-        interfaces_a, metrics_a = ra_processing.filter_interfaces(interface_list)
-        [
-            interfaces.append(interface)
-            for interface in interfaces_a
-            if interface not in interfaces
-        ]
-        [metrics.append(metric) for metric in metrics_a if metric not in metrics]
 
-    session["pair"]["name"] = ":".join(
-        [session["pair"]["nodes"][node]["label"] for node in session["pair"]["nodes"]]
-    )
-    session["interfaces"] = interfaces
-    session["metrics"] = metrics
-    parsed_metrics = ra_processing.main(
-        base_url=RA_url,
-        auth=RAauth,
-        interfaces=interfaces,
-        metric_labels=metrics,
-        data_start=start_date,
-        data_end=end_date,
-    )
-    session["vips"] = [
-        vip.replace("/Common/", "") for vip in parsed_metrics if "/Common/" in vip
-    ]
-    session["parsed_metrics"] = parsed_metrics
+def reload_results():
+    """Collect the user's pair and date range again after its data expired
 
-    return redirect
+    Returns:
+        Response: Redirect to loading page, or to pick a pair if none is loaded
+    """
+    if not session.get("pair"):
+        return redirect(url_for("clear_cache"))
+    session.pop("result", None)
+    session.pop("job", None)
+    return redirect(url_for("loading_page"))
 
 
 @web.route("/clear", methods=["GET", "POST"])
@@ -244,11 +353,11 @@ def clear_cache(new_pair: int = 0):
         new_pair (int, optional): Specify node pair to load on next page. Defaults to 0.
     """
     cookies = [
-        "parsed_metrics",
+        "result",
+        "job",
+        "pdf_job",
         "pair",
-        "interfaces",
         "metrics",
-        "vips",
         "start_date",
         "end_date",
     ]
@@ -277,13 +386,87 @@ def clear_cache(new_pair: int = 0):
 
 @web.route("/loading")
 def loading_page():
-    if "parsed_metrics" not in session:
-        get_data(url_for("pair_page"))
+    """Start background collection for the selected pair and show its progress"""
+    if get_results() is not None:
+        return redirect(url_for("pair_page"))
+    if not session.get("job") or web.jobs.get(session["job"]) is None:
+        pair, start_date, end_date = session_range()
+        # Users loading the same pair and range at once share one collection,
+        # metrics are discovered from the pair so they are not in the key
+        session["job"] = web.jobs.start(
+            get_data,
+            dict(web.my_config),
+            pair,
+            start_date,
+            end_date,
+            key=json.dumps([web.my_config["url"], pair, start_date, end_date]),
+        )
+    return render_template(
+        "loading.html",
+        title="Loading Data",
+        message="Please wait while loading metrics",
+        job_id=session["job"],
+        done_url=url_for("loading_done", job_id=session["job"]),
+        retry_url=url_for("clear_cache", new_pair=session["new_pair"]),
+        error_message="Unable to load metrics",
+    )
+
+
+@web.route("/loading/<job_id>")
+def loading_done(job_id: str):
+    """Add finished collection to user's session
+
+    Args:
+        job_id (str): ID of collection job
+    """
+    job = web.jobs.get(job_id)
+    if not job or job["status"] != "done":
+        return redirect(url_for("loading_page"))
+    session.update(job["result"])
+    session.pop("job", None)
     return redirect(url_for("pair_page"))
 
 
+@web.route("/progress/<job_id>")
+def job_progress(job_id: str):
+    """Report progress of a background job
+
+    Args:
+        job_id (str): ID of job
+    """
+    job = web.jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "unknown"}), 404
+    return jsonify(status=job["status"], error=job["error"], **job["progress"])
+
+
+@web.route("/metrics")
+def metrics_page():
+    """Time spent in each step, as Prometheus histograms for this worker"""
+    response = make_response(spans.prometheus())
+    response.headers.set("Content-Type", "text/plain; version=0.0.4")
+    return response
+
+
+@web.route("/debug/memory")
+def memory_page():
+    """Memory use of this worker and latest memory profiles of all workers
+
+    Profiles are recorded while memory_profile is enabled in settings.
+    """
+    options = ra_processing.config_options(web.my_config, memory.MEMORY_OPTIONS)
+    return jsonify(
+        worker=os.getpid(),
+        rss=memory.rss(),
+        enabled=options.get("memory_profile", 0) > 0,
+        reports=memory.recent_reports(),
+    )
+
+
 @web.route("/")
 def home_page():
+    if not hasattr(web, "pair_list") and web.pair_warmup.is_alive():
+        web.pair_warmup.join()
     if not hasattr(web, "pair_list"):
         get_pair_list()
     pair_list = []
@@ -295,18 +478,21 @@ def home_page():
 @web.route("/pair")
 def pair_page():
     """Summary page for pair of nodes"""
+    import plotly
+    import trending
+
     if web.my_config["url"] is None:
         return redirect(url_for("settings_page"))
-    if "parsed_metrics" not in session:
-        return redirect(url_for("clear_cache"))
-    if session["parsed_metrics"]["node[device]"].get("stats"):
-        weekends = trending.find_weekends(session["parsed_metrics"], "node[device]")
+    parsed_metrics = get_results()
+    if parsed_metrics is None:
+        return reload_results()
+    if parsed_metrics["node[device]"].get("stats"):
+        weekends = trending.find_weekends(parsed_metrics, "node[device]")
         metric_list = trending.byte_metrics(session["metrics"])
-        trend_time = trending.time_trend(
-            session["parsed_metrics"], "node[device]", metric_list
-        )
-        trend_line = trending.time_lines(
-            session["parsed_metrics"], "node[device]", metric_list
+        trend_time = trending.time_trend(parsed_metrics, "node[device]", metric_list)
+        trend_line = trending.time_lines(parsed_metrics, "node[device]", metric_list)
+        trend_line = trending.downsample_lines(
+            *trend_line, **trending.graph_options(web.my_config)
         )
 
         fig1 = trending.get_trend_graph(trend_time)
@@ -321,7 +507,8 @@ def pair_page():
         "pair.html",
         fig1_json=fig1_json,
         fig2_json=fig2_json,
-        summary=session["parsed_metrics"]["node[device]"]["stats"],
+        summary=parsed_metrics["node[device]"]["stats"],
+        report_range=parsed_metrics["node[data]"]["range"],
     )
 
 
@@ -334,23 +521,26 @@ def vip_page(vip: str = None):
         If omitted, renders first VIP found.
         Defaults to None.
     """
+    import plotly
+    import trending
+
     if web.my_config["url"] is None:
         return redirect(url_for("settings_page"))
-    if "parsed_metrics" not in session:
-        return redirect(url_for("clear_cache"))
+    parsed_metrics = get_results()
+    if parsed_metrics is None:
+        return reload_results()
     if not vip:
         vip = request.args.get("vip")
     if not vip:
-        vip = session["vips"][0]
-    if vip in session["vips"]:
+        vip = session_vips()[0]
+    if vip in session_vips():
         interface = "/Common/" + vip
-        weekends = trending.find_weekends(session["parsed_metrics"], interface)
+        weekends = trending.find_weekends(parsed_metrics, interface)
         metric_list = trending.byte_metrics(session["metrics"])
-        trend_time = trending.time_trend(
-            session["parsed_metrics"], interface, metric_list
-        )
-        trend_line = trending.time_lines(
-            session["parsed_metrics"], interface, metric_list
+        trend_time = trending.time_trend(parsed_metrics, interface, metric_list)
+        trend_line = trending.time_lines(parsed_metrics, interface, metric_list)
+        trend_line = trending.downsample_lines(
+            *trend_line, **trending.graph_options(web.my_config)
         )
 
         fig1 = trending.get_trend_graph(trend_time)
@@ -363,30 +553,162 @@ def vip_page(vip: str = None):
             fig1_json=fig1_json,
             fig2_json=fig2_json,
             selected_vip=vip,
-            summary=session["parsed_metrics"][interface]["stats"],
+            summary=parsed_metrics[interface]["stats"],
         )
     else:
         return render_template("graph.html")
 
 
+def make_node_pdf(
+    config: dict,
+    result: str,
+    collection: tuple,
+    pair_name: str,
+    metrics: list,
+    filename: str,
+    progress=None,
+) -> dict:
+    """Render PDF of node summary and write it to static/pdf
+
+    Runs as a background job, so the PDF is serialized once, straight to disk.
+
+    Args:
+        config (dict): Application settings
+        result (str): Result cache key of collected data
+        collection (tuple): Pair and date range, to collect again if the
+        data has expired
+        pair_name (str): Node pair name
+        metrics (list): List of metrics to include on the report
+        filename (str): File name of PDF
+        progress (function, optional): Callback for pages rendered.
+        Defaults to None.
+
+    Returns:
+        dict: File name of PDF
+    """
+    import export
+    import renderer
+
+    def collect() -> dict:
+        key = get_data(config, *collection, progress=progress)["result"]
+        return web.results.load(key, shared=False)
+
+    def render(parsed_metrics: dict) -> export.PDF:
+        return export.render_node_pdf(
+            pair_name=pair_name,
+            vips=ra_processing.vip_names(parsed_metrics),
+            parsed_metrics=parsed_metrics,
+            metrics=metrics,
+            cache=renderer.open_cache(config),
+            progress=progress,
+            profile=profile,
+        )
+
+    profile = memory.open_profile(config, f"{pair_name} PDF")
+    vips = 0
+    try:
+        parsed_metrics = web.results.load(result, shared=False) or collect()
+        vips = len(ra_processing.vip_names(parsed_metrics))
+        if profile:
+            profile.mark("load")
+        try:
+            pdf = render(parsed_metrics)
+        except result_cache.ResultExpired:
+            # Evicted while rendering, to make room for other pairs
+            pdf = render(collect())
+        export.save_pdf(pdf, os.path.join("static/pdf", filename))
+        if profile:
+            profile.mark("pdf_output")
+    finally:
+        # Stops tracing even if rendering failed
+        if profile:
+            profile.finish(vips)
+    return {"file": filename}
+
+
+def pdf_ready(job: dict) -> bool:
+    """Check if a PDF job is still useful, running or done with its file on disk
+
+    Args:
+        job (dict): Job from job store
+
+    Returns:
+        bool: True if job is queued, running or its PDF exists
+    """
+    if job is None or job["status"] == "failed":
+        return False
+    if job["status"] != "done":
+        return True
+    filename = job["result"].get("file")
+    return filename is not None and exists(f"static/pdf/{filename}")
+
+
 @web.route("/node_pdf")
 def node_pdf():
-    """Generate PDF of node summary"""
-    if "parsed_metrics" not in session:
+    """Start background PDF generation of node summary and show its progress
+
+    Clients asking for JSON get the job ID and URLs to poll and download.
+    """
+    import trending
+
+    if get_results() is None:
         return redirect(url_for("pair_page"))
-    start_time = time.time()
-    pdf = export.render_node_pdf(
-        pair_name=session["pair"]["name"],
-        vips=session["vips"],
-        parsed_metrics=session["parsed_metrics"],
-        metrics=trending.byte_metrics(session["metrics"]),
+    if not session.get("pdf_job") or not pdf_ready(web.jobs.get(session["pdf_job"])):
+        filename = f"{session['pair']['name'].replace(':','_')}_{datetime.now().strftime('%Y_%m_%d_%H_%M')}.pdf"
+        session["pdf_job"] = web.pdf_jobs.start(
+            make_node_pdf,
+            dict(web.my_config),
+            session["result"],
+            session_range(),
+            session["pair"]["name"],
+            trending.byte_metrics(session["metrics"]),
+            filename,
+        )
+    job_id = session["pdf_job"]
+    if request.accept_mimetypes.best == "application/json":
+        return (
+            jsonify(
+                job=job_id,
+                progress=url_for("job_progress", job_id=job_id),
+                download=url_for("node_pdf_download", job_id=job_id),
+            ),
+            202,
+        )
+    return render_template(
+        "loading.html",
+        title="Generating PDF",
+        message="Please wait while the pair PDF is rendered",
+        job_id=job_id,
+        done_url=url_for("node_pdf_download", job_id=job_id),
+        retry_url=url_for("node_pdf"),
+        error_message="Unable to generate PDF",
+    )
+
+
+@web.route("/node_pdf/<job_id>")
+def node_pdf_download(job_id: str):
+    """Send PDF written by a background job
+
+    The file is streamed from disk with its Content-Length, and range
+    requests are supported so large downloads can be resumed.
+
+    Args:
+        job_id (str): ID of PDF job
+    """
+    job = web.jobs.get(job_id)
+    if job and job["status"] == "done" and "file" not in job["result"]:
+        # Not a PDF job, such as a pair collection
+        abort(404)
+    if not job or job["status"] != "done" or not pdf_ready(job):
+        return redirect(url_for("node_pdf"))
+    filename = job["result"]["file"]
+    return send_file(
+        os.path.abspath(f"static/pdf/{filename}"),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=filename,
+        conditional=True,
     )
-    response = make_response(pdf.output())
-    filename = f"{session['pair']['name'].replace(':','_')}_{datetime.fromtimestamp(start_time).strftime('%Y_%m_%d_%H_%M')}.pdf"
-    pdf.output(f"static/pdf/{filename}", "F")
-    response.headers.set("Content-Disposition", "attachment", filename=filename)
-    response.headers.set("Content-Type", "application/pdf")
-    return response
 
 
 @web.route("/vip_pdf")
@@ -398,21 +720,28 @@ def vip_pdf(vip: str = None):
         If omitted, renders first VIP found.
         Defaults to None.
     """
-    if "parsed_metrics" not in session:
+    import export
+    import renderer
+    import trending
+
+    parsed_metrics = get_results()
+    if parsed_metrics is None:
         return redirect(url_for("vip_page", vip=vip))
     if not vip:
         vip = request.args.get("vip")
     if not vip:
-        vip = session["vips"][0]
-    if vip in session["vips"]:
+        vip = session_vips()[0]
+    if vip in session_vips():
         start_time = time.time()
         pdf = export.render_vip_pdf(
             pair_name=session["pair"]["name"],
             vip=vip,
-            parsed_metrics=session["parsed_metrics"],
+            parsed_metrics=parsed_metrics,
             metrics=trending.byte_metrics(session["metrics"]),
+            cache=renderer.open_cache(web.my_config),
         )
-        response = make_response(pdf.output())
+        with spans.span("pdf_output"):
+            response = make_response(pdf.output())
         filename = (
             f"{vip}_{datetime.fromtimestamp(start_time).strftime('%Y_%m_%d_%H_%M')}.pdf"
         )
@@ -433,13 +762,27 @@ def top_n_page(metric: str = None):
         metric (str, optional): Name of metric to filter results by.
         Defaults to None.
     """
-    if "parsed_metrics" not in session:
+    parsed_metrics = get_results()
+    if parsed_metrics is None:
         return redirect(url_for("vip_page"))
-    if metric in session["parsed_metrics"]["node[top_n]"]:
-        top_n = {metric: session["parsed_metrics"]["node[top_n]"][metric]}
+    show_all = request.args.get("all") == "1"
+    if show_all:
+        # Only rank every VIP when asked, the stored ranking is trimmed
+        ranking = ra_processing.top_n_stats(parsed_metrics, 0)
+    else:
+        ranking = parsed_metrics["node[top_n]"]
+    if metric in ranking:
+        top_n = {metric: ranking[metric]}
     else:
-        top_n = session["parsed_metrics"]["node[top_n]"]
-    return render_template("top_n.html", selected_metric=metric, top_n=top_n)
+        top_n = ranking
+    return render_template(
+        "top_n.html",
+        selected_metric=metric,
+        top_n=top_n,
+        top_n_limit=parsed_metrics["node[data]"].get("top_n", 0),
+        show_all=show_all,
+        parsed_metrics=parsed_metrics,
+    )
 
 
 @web.route("/settings", methods=["GET", "POST"])
@@ -463,6 +806,7 @@ def settings_page():
 
 @web.route("/settings/reload")
 def reload_settings():
+    web.discovery.invalidate()
     delattr(web, "pair_list")
     return redirect(url_for("home_page"))
 
@@ -0,0 +1,157 @@
+# discovery.py
+
+# Node resources from OpenNMS shared between users and workers
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.auth import HTTPBasicAuth
+
+import ra_processing
+import spans
+import sqlite_store
+
+PATH = "cache/discovery.sqlite"
+# Seconds node resources are reused before being fetched again
+TTL = 3600
+# Most nodes fetched from OpenNMS at once
+WORKERS = 8
+
+# Settings from config.json used by open_cache()
+DISCOVERY_OPTIONS = {
+    "discovery_ttl": TTL,
+}
+
+
+@spans.timed("discovery")
+def discover_node(url: str, auth: HTTPBasicAuth, node: str) -> dict:
+    """Fetch resources for a node and keep the parts used for collection
+
+    Args:
+        url (str): URL to OpenNMS API
+        auth (HTTPBasicAuth): Authentication credentials
+        node (str): Foreign source name and ID of node
+
+    Returns:
+        dict: Node label and name, VIP resource IDs and their metrics
+    """
+    interface_list = ra_processing.get_interfaces(url, auth, node)
+    interfaces, metrics = ra_processing.filter_interfaces(interface_list)
+    return {
+        "label": interface_list["label"],
+        "name": interface_list["name"],
+        "interfaces": interfaces,
+        "metrics": metrics,
+    }
+
+
+class DiscoveryCache(sqlite_store.Store):
+    """Node resources in SQLite, fetched again after a TTL or invalidation"""
+
+    def __init__(self, path: str = PATH, ttl: int = TTL) -> None:
+        super().__init__(path)
+        self.ttl = ttl
+        with self.connect() as db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS nodes (
+                    url TEXT NOT NULL,
+                    node TEXT NOT NULL,
+                    fetched REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (url, node)
+                )"""
+            )
+
+    def load(self, url: str, nodes: list, stale: bool = False) -> dict:
+        """Get cached resources for nodes
+
+        Args:
+            url (str): URL to OpenNMS API
+            nodes (list): Foreign source name and ID of each node
+            stale (bool, optional): Include expired resources. Defaults to False.
+
+        Returns:
+            dict: Resources of each node found and not expired
+        """
+        oldest = 0 if stale else time.time() - self.ttl
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT node, data FROM nodes WHERE url = ? AND fetched >= ?",
+                (url, oldest),
+            ).fetchall()
+        return {node: json.loads(data) for node, data in rows if node in nodes}
+
+    def save(self, url: str, found: dict):
+        """Add node resources to cache
+
+        Args:
+            url (str): URL to OpenNMS API
+            found (dict): Resources of each node
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)",
+                [(url, node, now, json.dumps(data)) for node, data in found.items()],
+            )
+
+    def invalidate(self, nodes: list = None):
+        """Forget cached resources so they are fetched again
+
+        Args:
+            nodes (list, optional): Nodes to forget. Defaults to None, for all.
+        """
+        with self.connect() as db:
+            if nodes is None:
+                db.execute("DELETE FROM nodes")
+            else:
+                db.executemany(
+                    "DELETE FROM nodes WHERE node = ?", [(node,) for node in nodes]
+                )
+
+    def discover(self, url: str, auth: HTTPBasicAuth, nodes: list) -> dict:
+        """Get resources for nodes, fetching missing or expired ones in parallel
+
+        Args:
+            url (str): URL to OpenNMS API
+            auth (HTTPBasicAuth): Authentication credentials
+            nodes (list): Foreign source name and ID of each node
+
+        Returns:
+            dict: Node label and name, VIP resource IDs and metrics for each node
+        """
+        found = self.load(url, nodes)
+        missing = [node for node in dict.fromkeys(nodes) if node not in found]
+        if missing:
+            with ThreadPoolExecutor(
+                max_workers=min(WORKERS, len(missing)), thread_name_prefix="discover"
+            ) as executor:
+                futures = {
+                    node: executor.submit(discover_node, url, auth, node)
+                    for node in missing
+                }
+            fetched = {node: future.result() for node, future in futures.items()}
+            # Nodes OpenNMS did not find are not cached, so they are retried
+            self.save(
+                url,
+                {
+                    node: data
+                    for node, data in fetched.items()
+                    if not data["label"].endswith("-NotFound)")
+                },
+            )
+            found.update(fetched)
+        return {node: found[node] for node in nodes}
+
+
+def open_cache(config: dict) -> DiscoveryCache:
+    """Open discovery cache using settings from config
+
+    Args:
+        config (dict): Application settings
+
+    Returns:
+        DiscoveryCache: Shared discovery cache
+    """
+    return sqlite_store.open_store(DiscoveryCache, PATH, config, DISCOVERY_OPTIONS)
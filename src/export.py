@@ -2,19 +2,36 @@
 
 # PDF generation
 
+import io
 import json
+import multiprocessing
+import multiprocessing.connection
 import os
-import shutil
+import re
+import tempfile
 import time
+import traceback
+import zipfile
 from datetime import datetime
 
-import plotly
-from fpdf import FPDF, HTMLMixin
+from fpdf import FPDF
 from requests.auth import HTTPBasicAuth
 
+import discovery
+import memory
 import ra_processing
+import renderer
+import spans
 import trending
 
+# Pairs collected and rendered at once by render_all_nodes_pdf()
+EXPORT_WORKERS = 4
+OUTPUT_DIR = "static/pdf"
+# Names of PDFs and run summaries written by render_all_nodes_pdf(), the only
+# files removed from the output folder and the folder above it
+PDF_NAME = re.compile(r".+_\d{4}_\d{2}_\d{2}_\d{2}_\d{2}\.pdf")
+SUMMARY_NAME = re.compile(r"all_pairs_\d{4}_\d{2}_\d{2}_\d{2}_\d{2}\.(zip|json)")
+
 
 def numberFormat(value: float, round: int = 2) -> str:
     """Formats numbers with commas and decimals
@@ -30,7 +47,7 @@ def numberFormat(value: float, round: int = 2) -> str:
     return num_format.format(float(value))
 
 
-class PDF(FPDF, HTMLMixin):
+class PDF(FPDF):
     def __init__(self) -> None:
         super().__init__(orientation="P", unit="mm", format="letter")
 
@@ -84,16 +101,62 @@ class PDF(FPDF, HTMLMixin):
         self.image("ra_config/logo.png", link="", type="", h=7)
         self.titles(f"""{pair_name}     {page_name}""")
 
-    def add_image(self, image_path: str, x: float, y: float):
+    def add_image(self, image: io.BytesIO, x: float, y: float):
         """Add image to current page
 
         Args:
-            image_path (str): Path to image file
+            image (io.BytesIO): Image data, or path to image file
             x (int): X coordinate of image
             y (int): Y coordinate of image
         """
         self.set_xy(x, y)
-        self.image(image_path, link="", type="", w=self.w - (x * 2))
+        self.image(image, link="", type="", w=self.w - (x * 2))
+
+    def table_header(self, headers: list, widths: list, x: float, height: float):
+        """Add bold column titles to table
+
+        Args:
+            headers (list): Column titles
+            widths (list): Column widths
+            x (float): X coordinate of table
+            height (float): Row height
+        """
+        self.set_font("Helvetica", "B", self.font_size_pt)
+        self.set_x(x)
+        for title, width in zip(headers, widths):
+            self.cell(w=width, h=height, txt=title, border="B", align="C")
+        self.ln(height)
+
+    def table(self, headers: list, widths: list, rows, x: float, y: float):
+        """Add table of names followed by numbers, drawn cell by cell
+
+        Uses the current font size. When a row does not fit on the page a new
+        page is added and the column titles are repeated.
+
+        Args:
+            headers (list): Column titles
+            widths (list): Width of each column as a fraction of the table
+            rows (iterable): Name and formatted numbers for each row
+            x (float): X coordinate of table, with the same margin on the right
+            y (float): Y coordinate of table
+        """
+        size = self.font_size_pt
+        height = self.font_size * 1.3
+        widths = [(self.w - x * 2) * width for width in widths]
+        self.set_xy(x, y)
+        self.table_header(headers, widths, x, height)
+        for row in rows:
+            if self.y + height > self.page_break_trigger:
+                self.add_page(same=True)
+                self.table_header(headers, widths, x, height)
+            self.set_x(x)
+            self.set_font("Helvetica", "", size)
+            self.cell(w=widths[0], h=height, txt=row[0])
+            self.set_font("Courier", "", size)
+            for text, width in zip(row[1:], widths[1:]):
+                self.cell(w=width, h=height, txt=text, align="R")
+            self.ln(height)
+        self.set_font("Helvetica", "", size)
 
     def interface_summary(self, summary: dict, x: float, y: float):
         """Add interface summary to page
@@ -103,60 +166,52 @@ class PDF(FPDF, HTMLMixin):
             x (int): X coordinate of table
             y (int): Y coordinate of table
         """
-        self.set_xy(x, y)
         self.set_font("Helvetica", size=10)
-        table_html = """
-            <table class="table" width="100%">
-                    <tr>
-                    <th width="20%">Metric</th>
-                    <th width="20%">Min</th>
-                    <th width="20%">Mean</th>
-                    <th width="20%">Max</th>
-                    <th width="20%">Total</th>
-                </tr>"""
-        for metric in summary:
-            table_html += f"<tr><td>{metric}</td>"
-            table_html += f'<td align="right"><font face="Courier">{numberFormat(summary[metric]["Min"])}</font></td>'
-            table_html += f'<td align="right"><font face="Courier">{numberFormat(summary[metric]["Average"])}</font></td>'
-            table_html += f'<td align="right"><font face="Courier">{numberFormat(summary[metric]["Max"])}</font></td>'
-            table_html += f'<td align="right"><font face="Courier">{numberFormat(summary[metric]["Total"])}</font></td></tr>'
-        table_html += "</table>"
-        self.write_html(table_html)
+        self.table(
+            ["Metric", "Min", "Mean", "Max", "Total"],
+            [0.2] * 5,
+            (
+                [metric]
+                + [
+                    numberFormat(summary[metric][stat])
+                    for stat in ("Min", "Average", "Max", "Total")
+                ]
+                for metric in summary
+            ),
+            x,
+            y,
+        )
 
     def top_n_summary(self, pair_name: str, parsed_metrics: dict, x: float, y: float):
         """Add page to PDF with top N summary
 
+        Reports rank every VIP, as node[top_n] is trimmed for the web page.
+
         Args:
             pair_name (str): Name of node pair
-            top_n (dict): Name of metric and top N values
+            parsed_metrics (dict): Collected metrics for all interfaces
             x (int): X coordinate of table
             y (int): Y coordinate of table
         """
-        top_n = parsed_metrics["node[top_n]"]
-        self.set_xy(x, y)
+        top_n = ra_processing.top_n_stats(parsed_metrics, 0)
         self.set_font("Helvetica", size=10)
         for metric in top_n:
             if top_n[metric]:
                 self.template_page(pair_name, f"Top VIPs: {metric}")
-                table_html = '<table width="100%">'
-                table_html += "<tr>"
-                table_html += '<th width="34%">VIP</th>'
-                table_html += f'<th width="33%">Average {metric}</th>'
-                table_html += f'<th width="33%">Peak {metric}</th>'
-                table_html += "</tr>"
-                for site in top_n[metric]:
-                    table_html += "<tr>"
-                    if "/" in site:
-                        table_html += f'<td>{site.rsplit("/", 1)[1]}</td>'
-                    else:
-                        table_html += f"<td>{site}</td>"
-                    table_html += f'<td align="right"><font face="Courier">{numberFormat(top_n[metric][site])}</font></td>'
-                    table_html += '<td align="right"><font face="Courier">'
-                    table_html += f'{numberFormat(parsed_metrics[site]["stats"][metric]["Max"])}</font></td>'
-                    table_html += "</tr>"
-                table_html += "<tr><td> </td><td> </td></tr>"
-                table_html += "</table>"
-                self.write_html(table_html)
+                self.table(
+                    ["VIP", f"Average {metric}", f"Peak {metric}"],
+                    [0.34, 0.33, 0.33],
+                    (
+                        [
+                            site.rsplit("/", 1)[-1],
+                            numberFormat(top_n[metric][site]),
+                            numberFormat(parsed_metrics[site]["stats"][metric]["Max"]),
+                        ]
+                        for site in top_n[metric]
+                    ),
+                    x,
+                    y,
+                )
 
 
 def generate_pdf(
@@ -185,7 +240,12 @@ def generate_pdf(
 
 
 def render_vip_pdf(
-    pair_name: str, vip: str, parsed_metrics: dict, metrics: list, pdf: PDF = None
+    pair_name: str,
+    vip: str,
+    parsed_metrics: dict,
+    metrics: list,
+    pdf: PDF = None,
+    cache: renderer.FigureCache = None,
 ) -> PDF:
     """Add VIP page to existing last page of PDF
 
@@ -197,6 +257,8 @@ def render_vip_pdf(
         pdf (PDF, optional): PDF object to use.
         Will create new PDF if None.
         Defaults to None.
+        cache (renderer.FigureCache, optional): Cache of chart images.
+        Defaults to None.
 
     Returns:
         PDF: PDF with VIP summary added
@@ -221,29 +283,25 @@ def render_vip_pdf(
     trend_line = trending.time_lines(parsed_metrics, interface, metrics)
 
     fig1 = trending.get_trend_graph(trend_time, margin=10)
-    fig2 = trending.get_trend_line(trend_line[0], trend_line[1], weekends, margin=10)
-
-    plotly.io.write_image(
-        fig1,
-        file=f"temp/fig-{vip.replace('/','-')}-1.png",
-        format="png",
-        width=1350,
-        height=600,
+    # Kaleido draws SVG lines reliably, WebGL is only used in browsers
+    fig2 = trending.get_trend_line(
+        trend_line[0], trend_line[1], weekends, margin=10, webgl=False
     )
-    pdf.add_image(f"temp/fig-{vip.replace('/','-')}-1.png", 10, 75)
-    plotly.io.write_image(
-        fig2,
-        file=f"temp/fig-{vip.replace('/','-')}-2.png",
-        format="png",
-        width=1350,
-        height=600,
-    )
-    pdf.add_image(f"temp/fig-{vip.replace('/','-')}-2.png", 10, 170)
+
+    images = renderer.render_png([fig1, fig2], cache=cache)
+    pdf.add_image(io.BytesIO(images[0]), 10, 75)
+    pdf.add_image(io.BytesIO(images[1]), 10, 170)
     return pdf
 
 
 def render_node_pdf(
-    pair_name: str, vips: list, parsed_metrics: dict, metrics: list
+    pair_name: str,
+    vips: list,
+    parsed_metrics: dict,
+    metrics: list,
+    cache: renderer.FigureCache = None,
+    progress=None,
+    profile: memory.MemoryProfile = None,
 ) -> PDF:
     """Generate PDF for all VIPs on a node pair
 
@@ -252,10 +310,17 @@ def render_node_pdf(
         vips (list): List of VIPs to include on the report
         parsed_metrics (dict): Data to include on the page
         metrics (list): List of metrics to include on the page
+        cache (renderer.FigureCache, optional): Cache of chart images.
+        Defaults to None.
+        progress (function, optional): Callback for pages rendered.
+        Defaults to None.
+        profile (memory.MemoryProfile, optional): Profile to record memory
+        after figures are built and drawn into pages. Defaults to None.
 
     Returns:
         PDF: PDF with all VIPs added
     """
+    start_time = time.time()
     pdf = generate_pdf(
         pair_name,
         "Summary",
@@ -263,81 +328,392 @@ def render_node_pdf(
         parsed_metrics["node[data]"]["range"],
     )
     # pdf.interface_summary(parsed_metrics['node[device]']['stats'], 10, 30)
-    pdf = render_vip_pdf(pair_name, "Summary", parsed_metrics, metrics, pdf)
-    pdf.top_n_summary(pair_name, parsed_metrics, 10, 22)
-    for vip in vips:
+    pdf = render_vip_pdf(pair_name, "Summary", parsed_metrics, metrics, pdf, cache)
+    pdf.top_n_summary(pair_name, parsed_metrics, 10, 29)
+    for done, vip in enumerate(vips):
+        if progress:
+            elapsed = time.time() - start_time
+            progress(
+                {
+                    "phase": "rendering",
+                    "done": done,
+                    "total": len(vips),
+                    "unit": "VIPs",
+                    "eta": elapsed / done * (len(vips) - done) if done else None,
+                }
+            )
         # interface = "/Common/" + vip
         pdf.template_page(pair_name, vip)
-        pdf = render_vip_pdf(pair_name, vip, parsed_metrics, metrics, pdf)
+        pdf = render_vip_pdf(pair_name, vip, parsed_metrics, metrics, pdf, cache)
 
+    if profile:
+        profile.mark("figures")
     return pdf
 
 
-def render_all_nodes_pdf() -> None:
-    """Generate PDF for all node pairs"""
+def file_mode() -> int:
+    """Find permissions open() gives new files, from the process umask
+
+    Returns:
+        int: File mode bits
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    # Reading the umask means setting it, so set the usual value meanwhile
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def save_pdf(pdf: PDF, path: str):
+    """Write PDF to file, replacing an earlier copy only once it is complete
+
+    Args:
+        pdf (PDF): PDF to write
+        path (str): File name of PDF
+    """
+    handle, temp_path = tempfile.mkstemp(
+        suffix=".part", dir=os.path.dirname(path) or "."
+    )
+    try:
+        with os.fdopen(handle, "wb") as f:
+            with spans.span("pdf_output"):
+                f.write(pdf.output())
+        # Temporary files are private, give the PDF the usual permissions
+        os.chmod(temp_path, file_mode())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def pair_details(pair: list, found: dict) -> tuple:
+    """Combine discovered resources for nodes in a pair
+
+    Args:
+        pair (list): Foreign source and ID of nodes in the pair
+        found (dict): Discovered resources for each node
+
+    Returns:
+        tuple: Pair name, VIP resource IDs and metrics
+    """
+    interfaces = []
+    metrics = []
+    name = []
+    for node in pair:
+        name.append(found[node]["label"].split(" ")[1][1:-1])
+        interfaces_a, metrics_a = found[node]["interfaces"], found[node]["metrics"]
+        [
+            interfaces.append(interface)
+            for interface in interfaces_a
+            if interface not in interfaces
+        ]
+        [metrics.append(metric) for metric in metrics_a if metric not in metrics]
+    return ":".join(name), interfaces, metrics
+
+
+def render_pair_pdf(
+    config: dict,
+    pair: list,
+    found: dict,
+    data_start: int = None,
+    data_end: int = None,
+    output_dir: str = OUTPUT_DIR,
+    stamp: str = "",
+    profile_memory: bool = False,
+) -> dict:
+    """Collect data for a pair and write its PDF
+
+    Args:
+        config (dict): Application settings
+        pair (list): Foreign source and ID of nodes in the pair
+        found (dict): Discovered resources for each node
+        data_start (int, optional): Timestamp for start of data. Defaults to None.
+        data_end (int, optional): Timestamp for end of data. Defaults to None.
+        output_dir (str, optional): Folder for PDF. Defaults to OUTPUT_DIR.
+        stamp (str, optional): Date stamp for file name. Defaults to "".
+        profile_memory (bool, optional): Profile memory use, even if not
+        enabled in config. Defaults to False.
+
+    Returns:
+        dict: Pair name, VIP count, file name, seconds spent on each step,
+        spans recorded and memory report if profiled
+    """
     start_time = time.time()
+    # Spans recorded before this process was started belong to other runs
+    before = spans.snapshot()
+    # Connections are not shared with the process that started this one
+    ra_processing.configure_client(**ra_processing.client_options(config))
+    pair_name, interfaces, metrics = pair_details(pair, found)
+    if profile_memory:
+        profile = memory.MemoryProfile(pair_name)
+    else:
+        profile = memory.open_profile(config, pair_name)
+    parsed_metrics = ra_processing.main(
+        config["url"],
+        HTTPBasicAuth(config["username"], config["password"]),
+        interfaces,
+        metrics,
+        data_start,
+        data_end,
+        profile=profile,
+        **ra_processing.collection_options(config),
+    )
+    print(f"Collected data for {pair_name}")
+    result = {
+        "pair": pair_name,
+        "vips": parsed_metrics["node[data]"]["count"],
+        "file": None,
+        "collect": time.time() - start_time,
+    }
+    vips = ra_processing.vip_names(parsed_metrics)
+    if vips:
+        pdf = render_node_pdf(
+            pair_name=pair_name,
+            vips=vips,
+            parsed_metrics=parsed_metrics,
+            metrics=trending.byte_metrics(metrics),
+            cache=renderer.open_cache(config),
+            profile=profile,
+        )
+        result["file"] = f"{pair_name.replace(':','_')}_{stamp}.pdf"
+        save_pdf(pdf, os.path.join(output_dir, result["file"]))
+        if profile:
+            profile.mark("pdf_output")
+        print(f"Rendered {pair_name} PDF")
+    result["render"] = time.time() - start_time - result["collect"]
+    result["figures_per_second"] = renderer.throughput()
+    result["spans"] = spans.summary(before)
+    if profile:
+        result["memory"] = profile.finish(result["vips"])
+        print(memory.report_text(result["memory"]))
+    return result
+
+
+def run_task(connection, func, args: tuple):
+    """Run function in a child process and send back its result or error
+
+    Args:
+        connection (Connection): Pipe to parent process
+        func (function): Function to run
+        args (tuple): Arguments for function
+    """
+    try:
+        connection.send(("done", func(*args)))
+    except Exception:
+        traceback.print_exc()
+        connection.send(("failed", traceback.format_exc(limit=1).strip()))
+    finally:
+        connection.close()
+
+
+def run_isolated(tasks: dict, workers: int, timeout: float = None) -> dict:
+    """Run tasks in separate processes, a few at a time
+
+    A task that raises, crashes or runs past the timeout is reported as
+    failed without stopping the others.
+
+    Args:
+        tasks (dict): Function and arguments for each task name
+        workers (int): Most tasks running at once
+        timeout (float, optional): Seconds before a task is stopped.
+        Defaults to None, for no limit.
+
+    Returns:
+        dict: Status, result or error, and elapsed seconds for each task
+    """
+    pending = list(tasks)
+    running = {}
+    results = {}
+    while pending or running:
+        while pending and len(running) < max(workers, 1):
+            name = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=run_task, args=(sender, *tasks[name]), daemon=True
+            )
+            process.start()
+            sender.close()
+            running[name] = (process, receiver, time.time())
+        multiprocessing.connection.wait([task[1] for task in running.values()], 1)
+        for name, (process, receiver, started) in list(running.items()):
+            elapsed = time.time() - started
+            # Check before polling, a task may send its result and exit between
+            alive = process.is_alive()
+            if receiver.poll():
+                try:
+                    status, value = receiver.recv()
+                except EOFError:
+                    status, value = "failed", None
+                process.join()
+                if status == "failed" and value is None:
+                    value = f"Process exited with code {process.exitcode}"
+            elif not alive:
+                status, value = "failed", f"Process exited with code {process.exitcode}"
+            elif timeout and elapsed > timeout:
+                process.terminate()
+                process.join()
+                status, value = "failed", f"Stopped after {timeout} seconds"
+            else:
+                continue
+            receiver.close()
+            del running[name]
+            results[name] = {"status": status, "elapsed": elapsed}
+            results[name]["result" if status == "done" else "error"] = value
+            if status == "failed":
+                print(f"{name} failed: {value}")
+    return {name: results[name] for name in tasks}
+
+
+def render_all_nodes_pdf(
+    pairs: list = None,
+    data_start: int = None,
+    data_end: int = None,
+    output_dir: str = OUTPUT_DIR,
+    workers: int = EXPORT_WORKERS,
+    timeout: float = None,
+    profile_memory: bool = False,
+) -> dict:
+    """Generate PDF for all node pairs
+
+    Status, timings and spans recorded for the run are also written to
+    all_pairs_<date>.json, next to the zip file of PDFs.
+
+    Args:
+        pairs (list, optional): Pair names or node IDs to include.
+        Defaults to None, for all pairs.
+        data_start (int, optional): Timestamp for start of data. Defaults to None.
+        data_end (int, optional): Timestamp for end of data. Defaults to None.
+        output_dir (str, optional): Folder for PDFs. Defaults to OUTPUT_DIR.
+        workers (int, optional): Pairs processed at once.
+        Defaults to EXPORT_WORKERS.
+        timeout (float, optional): Seconds allowed for each pair.
+        Defaults to None, for no limit.
+        profile_memory (bool, optional): Profile memory use of each pair.
+        Defaults to False.
+
+    Returns:
+        dict: Status and timings for each pair
+    """
+    start_time = time.time()
+    before = spans.snapshot()
+    stamp = datetime.fromtimestamp(start_time).strftime("%Y_%m_%d_%H_%M")
     f = open("ra_config/config.json")
     config = json.load(f)
     f.close()
     RA_url = config["url"]
     RAauth = HTTPBasicAuth(config["username"], config["password"])
-    loop_count = 0
-    vip_count = 0
-    clear_report_temp()
+    ra_processing.configure_client(**ra_processing.client_options(config))
+    clear_report_temp(output_dir)
+    found = discovery.open_cache(config).discover(
+        RA_url, RAauth, [node for pair in config["nodes"] for node in pair]
+    )
+    tasks = {}
     for pair in config["nodes"]:
-        interfaces = []
-        metrics = []
-        name = []
-        loop_count += 1
-
-        for node in pair:
-            interface_list = ra_processing.get_interfaces(RA_url, RAauth, node)
-            name.append(interface_list["label"].split(" ")[1][1:-1])
-            interfaces_a, metrics_a = ra_processing.filter_interfaces(interface_list)
-            [
-                interfaces.append(interface)
-                for interface in interfaces_a
-                if interface not in interfaces
-            ]
-            [metrics.append(metric) for metric in metrics_a if metric not in metrics]
-
-        pair_name = ":".join(name)
-        parsed_metrics = ra_processing.main(RA_url, RAauth, interfaces, metrics)
-        print(f"Collected data for {pair_name}")
-        vip_count += parsed_metrics["node[data]"]["count"]
-        byte_metrics = trending.byte_metrics(metrics)
-        vips = [
-            vip.replace("/Common/", "") for vip in parsed_metrics if "/Common/" in vip
-        ]
-        if vips:
-            pdf = render_node_pdf(
-                pair_name=pair_name,
-                vips=vips,
-                parsed_metrics=parsed_metrics,
-                metrics=byte_metrics,
-            )
-        filename = f"{pair_name.replace(':','_')}_{datetime.fromtimestamp(start_time).strftime('%Y_%m_%d_%H_%M')}.pdf"
-        pdf.output(f"static/pdf/{filename}", "F")
-        print(f"Rendered {pair_name} PDF")
+        pair_name = pair_details(pair, found)[0]
+        if pairs and pair_name not in pairs and not set(pair) & set(pairs):
+            continue
+        tasks[pair_name] = (
+            render_pair_pdf,
+            (
+                config,
+                pair,
+                found,
+                data_start,
+                data_end,
+                output_dir,
+                stamp,
+                profile_memory,
+            ),
+        )
 
-    shutil.make_archive(
-        f"static/all_pairs_{datetime.fromtimestamp(start_time).strftime('%Y_%m_%d_%H_%M')}",
-        "zip",
-        "static/pdf/",
-    )
+    results = run_isolated(tasks, workers, timeout)
+
+    # Only add PDFs from this run, the output folder may hold other files
+    with zipfile.ZipFile(
+        os.path.join(os.path.dirname(output_dir.rstrip("/")), f"all_pairs_{stamp}.zip"),
+        "w",
+        zipfile.ZIP_DEFLATED,
+    ) as archive:
+        for result in results.values():
+            if (result.get("result") or {}).get("file"):
+                archive.write(
+                    os.path.join(output_dir, result["result"]["file"]),
+                    result["result"]["file"],
+                )
     end_time = time.time()
+    vip_count = sum(
+        [result["result"]["vips"] for result in results.values() if "result" in result]
+    )
     print(
-        f"Time to process {loop_count} pairs with {vip_count} VIPs: {end_time - start_time}"
+        f"{'Pair':40} {'Status':8} {'VIPs':>6} {'Collect':>9} {'Render':>9}"
+        f" {'Figs/s':>7}"
     )
+    for pair_name, result in results.items():
+        timing = result.get("result") or {}
+        print(
+            f"{pair_name:40} {result['status']:8} {timing.get('vips', 0):6}"
+            f" {timing.get('collect', result['elapsed']):9.1f}"
+            f" {timing.get('render', 0):9.1f}"
+            f" {timing.get('figures_per_second', 0):7.1f}"
+        )
+    print(
+        f"Time to process {len(results)} pairs with {vip_count} VIPs: {end_time - start_time}"
+    )
+    write_summary(
+        os.path.join(
+            os.path.dirname(output_dir.rstrip("/")), f"all_pairs_{stamp}.json"
+        ),
+        results,
+        spans.summary(before),
+        end_time - start_time,
+    )
+    return results
+
 
+def write_summary(path: str, results: dict, run_spans: dict, elapsed: float):
+    """Write JSON summary of a run of render_all_nodes_pdf()
 
-def clear_report_temp() -> None:
-    """Clear all cached report files"""
-    zip_files = os.scandir("static")
+    Args:
+        path (str): File name of summary
+        results (dict): Status and timings for each pair
+        run_spans (dict): Spans recorded outside of pair processes
+        elapsed (float): Seconds taken by the whole run
+    """
+    pair_spans = [
+        result["result"].get("spans", {})
+        for result in results.values()
+        if "result" in result
+    ]
+    summary = {
+        "elapsed": elapsed,
+        "pairs": results,
+        "spans": spans.merge([run_spans] + pair_spans),
+    }
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def clear_report_temp(output_dir: str = OUTPUT_DIR) -> None:
+    """Clear report files from earlier runs
+
+    Only files named like those written by render_all_nodes_pdf() are
+    removed, so other files in the folders are kept.
+
+    Args:
+        output_dir (str, optional): Folder of PDFs. Defaults to OUTPUT_DIR.
+    """
+    zip_files = os.scandir(os.path.dirname(output_dir.rstrip("/")) or ".")
     for file in zip_files:
-        if ".zip" in file.name:
+        if file.is_file() and SUMMARY_NAME.fullmatch(file.name):
             os.remove(file.path)
-    pdf_files = os.scandir("static/pdf")
+    os.makedirs(output_dir, exist_ok=True)
+    pdf_files = os.scandir(output_dir)
     for file in pdf_files:
-        if ".pdf" in file.name:
+        if file.is_file() and PDF_NAME.fullmatch(file.name):
             os.remove(file.path)
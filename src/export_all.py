@@ -2,6 +2,81 @@
 
 # Easy access to generate PDFs for all node pairs
 
+import argparse
+import sys
+from datetime import datetime
+
 import export
 
-export.render_all_nodes_pdf()
+
+def timestamp(value: str) -> int:
+    """Convert date from command line to timestamp in milliseconds
+
+    Args:
+        value (str): Date as YYYY-MM-DD or YYYY-MM-DDTHH:MM
+
+    Returns:
+        int: Timestamp in milliseconds
+    """
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Read command line options
+
+    Args:
+        args (list, optional): Arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed options
+    """
+    parser = argparse.ArgumentParser(description="Generate PDFs for node pairs")
+    parser.add_argument(
+        "--pair",
+        action="append",
+        dest="pairs",
+        metavar="PAIR",
+        help="Pair name (node:node) or node ID to include, can be repeated."
+        " Defaults to all pairs.",
+    )
+    parser.add_argument(
+        "--start", type=timestamp, help="Start of data, defaults to 30 days ago"
+    )
+    parser.add_argument("--end", type=timestamp, help="End of data, defaults to now")
+    parser.add_argument(
+        "--output",
+        default=export.OUTPUT_DIR,
+        help=f"Folder for PDFs, defaults to {export.OUTPUT_DIR}. PDFs from earlier"
+        " runs (<pair>_<date>.pdf) are removed from it, and all_pairs_<date>"
+        " zip and JSON files from the folder above it. Other files are kept.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=export.EXPORT_WORKERS,
+        help=f"Pairs processed at once, defaults to {export.EXPORT_WORKERS}",
+    )
+    parser.add_argument(
+        "--timeout", type=float, help="Seconds allowed for each pair, defaults to none"
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Report memory use of each pair by phase, with top allocation sites",
+    )
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    results = export.render_all_nodes_pdf(
+        pairs=options.pairs,
+        data_start=options.start,
+        data_end=options.end,
+        output_dir=options.output,
+        workers=options.workers,
+        timeout=options.timeout,
+        profile_memory=options.profile_memory,
+    )
+    if any(result["status"] != "done" for result in results.values()):
+        sys.exit(1)
@@ -0,0 +1,249 @@
+# jobs.py
+
+# Background jobs with progress shared between workers
+
+import json
+import os
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlite_store
+
+PATH = "cache/jobs.sqlite"
+# Jobs running at once in each web worker process
+WORKERS = 2
+# PDF jobs running at once in each web worker process, in their own threads
+# so PDFs cannot hold up collections
+PDF_WORKERS = 1
+# Seconds without an update before a running job is treated as lost
+STALE = 300
+# Seconds between progress writes for a job
+UPDATE_INTERVAL = 1
+# Seconds to keep finished jobs
+KEEP = 86400
+
+
+def process_start(pid: int) -> str:
+    """Read when a process started, to tell it from a later one with its ID
+
+    Args:
+        pid (int): Process ID
+
+    Returns:
+        str: Start time in clock ticks since boot, empty if unknown
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ""
+
+
+def current_owner() -> str:
+    """Identify this process as the owner of the jobs it runs
+
+    Returns:
+        str: Process ID and start time
+    """
+    return f"{os.getpid()}:{process_start(os.getpid())}"
+
+
+def owner_alive(owner: str) -> bool:
+    """Check if the process running a job is still there
+
+    Jobs are shared through a local SQLite file, so owners are on this host.
+
+    Args:
+        owner (str): Owner from current_owner()
+
+    Returns:
+        bool: False if the process has exited or its ID was reused
+    """
+    pid, started = owner.split(":")
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return process_start(int(pid)) == started
+
+
+def job_lost(status: str, updated: float, owner: str) -> bool:
+    """Check if a queued or running job will never finish
+
+    Args:
+        status (str): Job status
+        updated (float): Time of the last update
+        owner (str): Process running the job, None if not recorded
+
+    Returns:
+        bool: True if its process has gone, or it is running without updates
+    """
+    if status not in ["queued", "running"]:
+        return False
+    if owner and not owner_alive(owner):
+        return True
+    # Queued jobs wait for a free thread without updates
+    return status == "running" and updated < time.time() - STALE
+
+
+class JobStore(sqlite_store.Store):
+    """Run jobs in a thread pool, with state kept in SQLite for all workers"""
+
+    def __init__(self, path: str = PATH, workers: int = WORKERS) -> None:
+        super().__init__(path)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job"
+        )
+        self.last_update = {}
+        with self.connect() as db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    key TEXT,
+                    owner TEXT
+                )"""
+            )
+            columns = [row[1] for row in db.execute("PRAGMA table_info(jobs)")]
+            for column in ["key", "owner"]:
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+
+    def start(self, func, *args, key: str = None, **kwargs) -> str:
+        """Queue a job, or join a running job with the same key
+
+        The function is called with a progress keyword argument, a callback
+        that takes a dict of progress details. Its return value must be JSON
+        serializable.
+
+        Args:
+            func (function): Function to run
+            key (str, optional): Jobs with the same key, from any worker, share
+            one run while it is queued or running in a live worker.
+            Defaults to None.
+
+        Returns:
+            str: Job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.connect() as db:
+            # Lock the database so only one worker can start a job for the key
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM jobs WHERE updated < ?", (now - KEEP,))
+            if key is not None:
+                row = db.execute(
+                    """SELECT id, status, updated, owner FROM jobs
+                    WHERE key = ? AND status IN ('queued', 'running')
+                    ORDER BY created DESC LIMIT 1""",
+                    (key,),
+                ).fetchone()
+                if row and not job_lost(*row[1:]):
+                    return row[0]
+                if row:
+                    db.execute(
+                        """UPDATE jobs SET status = 'failed', updated = ?,
+                        error = 'Job stopped responding' WHERE id = ?""",
+                        (now, row[0]),
+                    )
+            db.execute(
+                "INSERT INTO jobs VALUES (?, 'queued', NULL, NULL, NULL, ?, ?, ?, ?)",
+                (job_id, now, now, key, current_owner()),
+            )
+        self.executor.submit(self.run, job_id, func, args, kwargs)
+        return job_id
+
+    def run(self, job_id: str, func, args: tuple, kwargs: dict):
+        """Run job and record its result
+
+        Args:
+            job_id (str): Job ID
+            func (function): Function to run
+            args (tuple): Positional arguments for function
+            kwargs (dict): Keyword arguments for function
+        """
+        self.update(job_id, {"phase": "starting"}, force=True)
+        try:
+            result = func(
+                *args, progress=lambda status: self.update(job_id, status), **kwargs
+            )
+        except Exception:
+            traceback.print_exc()
+            self.finish(job_id, "failed", error=traceback.format_exc(limit=1))
+        else:
+            self.finish(job_id, "done", result=result)
+
+    def update(self, job_id: str, progress: dict, force: bool = False):
+        """Record job progress
+
+        Args:
+            job_id (str): Job ID
+            progress (dict): Progress details
+            force (bool, optional): Write even if recently updated.
+            Defaults to False.
+        """
+        now = time.time()
+        if not force and now - self.last_update.get(job_id, 0) < UPDATE_INTERVAL:
+            return
+        self.last_update[job_id] = now
+        with self.connect() as db:
+            db.execute(
+                """UPDATE jobs SET status = 'running', progress = ?, updated = ?
+                WHERE id = ?""",
+                (json.dumps(progress), now, job_id),
+            )
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None):
+        """Record job completion
+
+        Args:
+            job_id (str): Job ID
+            status (str): Final status, "done" or "failed"
+            result (optional): Return value of the job. Defaults to None.
+            error (str, optional): Error message. Defaults to None.
+        """
+        self.last_update.pop(job_id, None)
+        with self.connect() as db:
+            db.execute(
+                """UPDATE jobs SET status = ?, result = ?, error = ?, updated = ?
+                WHERE id = ?""",
+                (status, json.dumps(result), error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> dict:
+        """Get job status
+
+        Args:
+            job_id (str): Job ID
+
+        Returns:
+            dict: Status, progress, result and error of job, or None if unknown
+        """
+        with self.connect() as db:
+            row = db.execute(
+                """SELECT status, progress, result, error, updated, owner FROM jobs
+                WHERE id = ?""",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "status": row[0],
+            "progress": json.loads(row[1] or "{}"),
+            "result": json.loads(row[2] or "null"),
+            "error": row[3],
+        }
+        if job_lost(row[0], row[4], row[5]):
+            job["status"] = "failed"
+            job["error"] = "Job stopped responding"
+        return job
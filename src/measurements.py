@@ -0,0 +1,119 @@
+# measurements.py
+
+# Streaming decoder for Measurements API responses
+
+import codecs
+import json
+import re
+
+import numpy as np
+
+# Start of a timestamp or value array, not inside an escaped string
+ARRAY_START = re.compile(r'(?<!\\)"(timestamps|values)"\s*:\s*\[')
+# Characters kept between chunks in case an array key is split across them
+KEY_OVERLAP = 32
+
+
+def parse_numbers(text: str, dtype) -> np.ndarray:
+    """Convert comma separated JSON numbers to an array
+
+    Args:
+        text (str): Numbers separated by commas, "NaN" strings allowed
+        dtype: Type of array to create
+
+    Returns:
+        np.ndarray: Parsed numbers
+    """
+    text = text.replace('"', "").strip()
+    if not text:
+        return np.array([], dtype=dtype)
+    return np.array(text.split(","), dtype=dtype)
+
+
+class MeasurementsDecoder:
+    """Incremental decoder for Measurements API responses
+
+    Timestamp and value arrays are parsed into int64/float64 arrays as chunks
+    arrive, so the full JSON text and its Python lists are never held in
+    memory. Everything else is small and parsed with json at the end.
+    """
+
+    def __init__(self) -> None:
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.skeleton = []
+        self.arrays = []
+        self.array = None
+
+    def feed(self, chunk: bytes):
+        """Decode next part of the response body
+
+        Args:
+            chunk (bytes): Response body data
+        """
+        self.buffer += self.decoder.decode(chunk)
+        self.process()
+
+    def process(self):
+        """Move complete arrays and JSON text out of the buffer"""
+        while True:
+            if self.array is None:
+                match = ARRAY_START.search(self.buffer)
+                if not match:
+                    keep = max(len(self.buffer) - KEY_OVERLAP, 0)
+                    self.skeleton.append(self.buffer[:keep])
+                    self.buffer = self.buffer[keep:]
+                    return
+                # Leave an empty array in the JSON text to fill in later
+                self.skeleton.append(self.buffer[: match.end()] + "]")
+                self.buffer = self.buffer[match.end() :]
+                name = match.group(1)
+                dtype = np.int64 if name == "timestamps" else np.float64
+                self.array = (name, dtype, [])
+            else:
+                name, dtype, parts = self.array
+                end = self.buffer.find("]")
+                if end < 0:
+                    # Parse complete numbers, keeping a partial one for next chunk
+                    cut = self.buffer.rfind(",")
+                    if cut > 0:
+                        parts.append(parse_numbers(self.buffer[:cut], dtype))
+                        self.buffer = self.buffer[cut + 1 :]
+                    return
+                parts.append(parse_numbers(self.buffer[:end], dtype))
+                self.buffer = self.buffer[end + 1 :]
+                self.arrays.append((name, np.concatenate(parts)))
+                self.array = None
+
+    def result(self) -> dict:
+        """Finish decoding
+
+        Returns:
+            dict: API response, with arrays for timestamps and column values
+        """
+        self.buffer += self.decoder.decode(b"", final=True)
+        self.process()
+        self.skeleton.append(self.buffer)
+        metric_data = json.loads("".join(self.skeleton))
+        columns = iter(metric_data.get("columns") or [])
+        for name, array in self.arrays:
+            if name == "timestamps":
+                metric_data["timestamps"] = array
+            else:
+                next(columns)["values"] = array
+        return metric_data
+
+
+def decode(chunks) -> dict:
+    """Decode Measurements API response from chunks of the body
+
+    Args:
+        chunks (iterable): Response body as bytes chunks
+
+    Returns:
+        dict: API response, with arrays for timestamps and column values
+    """
+    decoder = MeasurementsDecoder()
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.result()
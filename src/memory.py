@@ -0,0 +1,226 @@
+# memory.py
+
+# Opt-in memory profiling of collection and PDF rendering, by phase
+
+import json
+import os
+import resource
+import time
+import tracemalloc
+from threading import Lock
+
+import ra_processing
+
+PATH = "cache/memory_profile.jsonl"
+# Allocation sites listed for each phase
+TOP_SITES = 10
+# Frames kept for each allocation, more frames cost more memory while tracing
+FRAMES = 1
+# Reports shown by the debug page
+KEEP = 20
+# Size of the report file before it is moved to PATH.1, replacing older reports
+MAX_BYTES = 1024 * 1024
+
+# Settings from config.json used by open_profile()
+MEMORY_OPTIONS = {
+    "memory_profile": 0,
+}
+
+# Profiles running in this process, tracemalloc is stopped after the last one
+running = 0
+running_lock = Lock()
+
+
+def rss() -> int:
+    """Read resident memory of this process
+
+    Returns:
+        int: Resident set size in bytes, or peak size if current is unknown
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Linux reports the peak in KB, macOS in bytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class MemoryProfile:
+    """Memory use at phase boundaries, from tracemalloc snapshots and RSS
+
+    Tracing covers the whole process, so allocations from other threads
+    running at the same time are included.
+    """
+
+    def __init__(self, name: str, top: int = TOP_SITES) -> None:
+        global running
+        self.name = name
+        self.top = top
+        with running_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(FRAMES)
+            running += 1
+        self.started = time.time()
+        self.phases = []
+        self.snapshot = self.take_snapshot()
+        self.rss = rss()
+        self.traced = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        """Snapshot traced allocations, leaving out tracing and import internals
+
+        Returns:
+            tracemalloc.Snapshot: Current allocations
+        """
+        return tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ]
+        )
+
+    def mark(self, phase: str):
+        """Record memory at the end of a phase
+
+        Args:
+            phase (str): Name of the phase that just finished
+        """
+        if self.snapshot is None:
+            return
+        snapshot = self.take_snapshot()
+        current_rss = rss()
+        traced, peak = tracemalloc.get_traced_memory()
+        sites = [
+            {
+                "site": str(stat.traceback),
+                "size": stat.size_diff,
+                "count": stat.count_diff,
+            }
+            for stat in snapshot.compare_to(self.snapshot, "lineno")[: self.top]
+            if stat.size_diff
+        ]
+        self.phases.append(
+            {
+                "phase": phase,
+                "rss": current_rss,
+                "rss_change": current_rss - self.rss,
+                "traced": traced,
+                "traced_change": traced - self.traced,
+                "traced_peak": peak,
+                "top": sites,
+            }
+        )
+        self.snapshot = snapshot
+        self.rss = current_rss
+        self.traced = traced
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def finish(self, vips: int = 0) -> dict:
+        """Stop profiling and save the report
+
+        Args:
+            vips (int, optional): VIPs in the run, for bytes per VIP.
+            Defaults to 0.
+
+        Returns:
+            dict: Memory report for each phase
+        """
+        global running
+        if self.snapshot is not None:
+            self.snapshot = None
+            with running_lock:
+                running -= 1
+                if not running:
+                    tracemalloc.stop()
+        for phase in self.phases:
+            phase["bytes_per_vip"] = phase["traced_change"] / vips if vips else None
+        report = {
+            "name": self.name,
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "vips": vips,
+            "peak_rss": max([phase["rss"] for phase in self.phases] + [rss()]),
+            "phases": self.phases,
+        }
+        try:
+            os.makedirs(os.path.dirname(PATH), exist_ok=True)
+            with open(PATH, "a") as f:
+                f.write(json.dumps(report) + "\n")
+            if os.path.getsize(PATH) > MAX_BYTES:
+                # Workers still appending to the old file write to PATH.1
+                os.replace(PATH, PATH + ".1")
+        except OSError as e:
+            print(f"Unable to save memory profile: {e}")
+        return report
+
+
+def report_text(report: dict) -> str:
+    """Format memory report for the console
+
+    Args:
+        report (dict): Report from MemoryProfile.finish()
+
+    Returns:
+        str: Phases with memory changes and their top allocation sites
+    """
+    mb = 1024 * 1024
+    lines = [
+        f"Memory profile for {report['name']}: peak RSS {report['peak_rss'] / mb:.1f} MB"
+        f" for {report['vips']} VIPs"
+    ]
+    for phase in report["phases"]:
+        per_vip = (
+            f", {phase['bytes_per_vip'] / 1024:.1f} KB per VIP"
+            if phase["bytes_per_vip"] is not None
+            else ""
+        )
+        lines.append(
+            f"  {phase['phase']}: RSS {phase['rss'] / mb:.1f} MB"
+            f" ({phase['rss_change'] / mb:+.1f}), traced {phase['traced'] / mb:.1f} MB"
+            f" ({phase['traced_change'] / mb:+.1f}, peak {phase['traced_peak'] / mb:.1f})"
+            f"{per_vip}"
+        )
+        for site in phase["top"]:
+            lines.append(
+                f"    {site['size'] / 1024:+10.1f} KB {site['count']:+8} {site['site']}"
+            )
+    return "\n".join(lines)
+
+
+def recent_reports(count: int = KEEP) -> list:
+    """Read latest saved memory reports
+
+    Args:
+        count (int, optional): Reports to read. Defaults to KEEP.
+
+    Returns:
+        list: Reports, newest first
+    """
+    lines = []
+    for path in [PATH + ".1", PATH]:
+        if os.path.exists(path):
+            with open(path) as f:
+                lines = (lines + f.readlines())[-count:]
+    return [json.loads(line) for line in reversed(lines)]
+
+
+def open_profile(config: dict, name: str) -> MemoryProfile:
+    """Start memory profile if enabled in config
+
+    Args:
+        config (dict): Application settings
+        name (str): Name of the run, such as the pair name
+
+    Returns:
+        MemoryProfile: Running profile, or None if disabled
+    """
+    options = dict(MEMORY_OPTIONS)
+    options.update(ra_processing.config_options(config, MEMORY_OPTIONS))
+    if options["memory_profile"] <= 0:
+        return None
+    return MemoryProfile(name)
@@ -0,0 +1,319 @@
+# metric_cache.py
+
+# Local SQLite cache of Measurements API data
+
+import sqlite3
+import time
+
+import numpy as np
+
+import sqlite_store
+import timeseries
+
+# Data newer than this (ms) may still change in OpenNMS and is fetched again
+SETTLE = 900000
+# Merge stored blocks for a metric once there are more than this many
+COMPACT_BLOCKS = 8
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS blocks (
+        resource_id TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        step INTEGER NOT NULL,
+        start INTEGER NOT NULL,
+        end INTEGER NOT NULL,
+        fetched INTEGER NOT NULL,
+        timestamps BLOB NOT NULL,
+        vals BLOB NOT NULL
+    )""",
+    """CREATE INDEX IF NOT EXISTS blocks_key
+        ON blocks (resource_id, step, metric, end)""",
+    """CREATE TABLE IF NOT EXISTS resources (
+        resource_id TEXT PRIMARY KEY,
+        label TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS settings (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+]
+
+
+def merge_ranges(ranges: list) -> list:
+    """Combine overlapping or adjacent time ranges
+
+    Args:
+        ranges (list): Inclusive (start, end) tuples
+
+    Returns:
+        list: Sorted, non-overlapping (start, end) tuples
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(start: int, end: int, covered: list) -> list:
+    """Find parts of a time range not in the covered ranges
+
+    Args:
+        start (int): Start of range
+        end (int): End of range
+        covered (list): Inclusive (start, end) tuples already available
+
+    Returns:
+        list: Inclusive (start, end) tuples still missing
+    """
+    missing = []
+    for cover_start, cover_end in merge_ranges(covered):
+        if cover_end < start or cover_start > end:
+            continue
+        if cover_start > start:
+            missing.append((start, cover_start - 1))
+        start = cover_end + 1
+    if start <= end:
+        missing.append((start, end))
+    return missing
+
+
+class MetricCache(sqlite_store.Store):
+    """Measurements stored on disk by resource, metric and step
+
+    Each fetch is saved as a block holding the time range it covers and its
+    timestamps and values as raw int64/float64 bytes. Resource IDs can be the
+    same on different OpenNMS servers, so the cache only holds data from one
+    server and is cleared when another one is used.
+    """
+
+    PRAGMAS = ["auto_vacuum=INCREMENTAL"]
+
+    def __init__(self, path: str, days: int, size_mb: int, source: str) -> None:
+        super().__init__(path)
+        self.days = days
+        self.size_mb = size_mb
+        self.source = source
+        with self.connect() as db:
+            for statement in SCHEMA:
+                db.execute(statement)
+            row = db.execute(
+                "SELECT value FROM settings WHERE name = 'source'"
+            ).fetchone()
+            if row is None or row[0] != source:
+                # Data cached before the server was recorded is dropped too
+                db.execute("DELETE FROM blocks")
+                db.execute("DELETE FROM resources")
+                db.execute(
+                    "INSERT OR REPLACE INTO settings VALUES ('source', ?)", (source,)
+                )
+
+    def current(self, db: sqlite3.Connection) -> bool:
+        """Check the cache still holds data from this server
+
+        Args:
+            db (sqlite3.Connection): Database connection
+
+        Returns:
+            bool: False if the cache was cleared for another server since opening
+        """
+        row = db.execute("SELECT value FROM settings WHERE name = 'source'").fetchone()
+        return row is not None and row[0] == self.source
+
+    def missing(
+        self, interface: str, metrics: list, step: int, start: int, end: int
+    ) -> list:
+        """Find time ranges not yet cached for any of the metrics
+
+        Args:
+            interface (str): Resource ID of interface
+            metrics (list): Metrics required
+            step (int): Step between timestamps
+            start (int): Timestamp for start of data required
+            end (int): Timestamp for end of data required
+
+        Returns:
+            list: Inclusive (start, end) tuples to request from OpenNMS
+        """
+        covered = {metric: [] for metric in metrics}
+        with self.connect() as db:
+            rows = db.execute(
+                """SELECT metric, start, end FROM blocks
+                WHERE resource_id = ? AND step = ? AND end >= ? AND start <= ?""",
+                (interface, step, start, end),
+            ).fetchall()
+        for metric, block_start, block_end in rows:
+            if metric in covered and block_end >= block_start:
+                covered[metric].append((block_start, block_end))
+        missing = []
+        for metric in metrics:
+            missing += subtract_ranges(start, end, covered[metric])
+        return merge_ranges(missing)
+
+    def save(
+        self,
+        interface: str,
+        step: int,
+        batch: tuple,
+        metric_data: dict,
+        fetched: int,
+    ):
+        """Store single interface Measurements API response
+
+        Args:
+            interface (str): Resource ID of interface
+            step (int): Step between timestamps
+            batch (tuple): Start and end timestamps that were requested
+            metric_data (dict): Raw API response for the interface
+            fetched (int): Timestamp the collection started
+        """
+        columns = metric_data.get("columns") or []
+        timestamps = metric_data.get("timestamps")
+        if timestamps is None or not len(timestamps) or not columns:
+            return
+        # Only recent enough data is marked as covered, the rest is fetched again
+        end = min(batch[1], fetched - SETTLE)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        rows = []
+        for metric, column in zip(metric_data["labels"], columns):
+            rows.append(
+                (
+                    interface,
+                    metric,
+                    step,
+                    batch[0],
+                    end,
+                    fetched,
+                    timestamps.tobytes(),
+                    timeseries.to_array(column["values"]).tobytes(),
+                )
+            )
+        with self.connect() as db:
+            if not self.current(db):
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO resources VALUES (?, ?)",
+                (interface, metric_data["metadata"]["resources"][0]["label"]),
+            )
+            db.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def load(
+        self, interface: str, metrics: list, step: int, start: int, end: int
+    ) -> tuple:
+        """Read cached data for an interface
+
+        Args:
+            interface (str): Resource ID of interface
+            metrics (list): Metrics to read
+            step (int): Step between timestamps
+            start (int): Timestamp for start of data
+            end (int): Timestamp for end of data
+
+        Returns:
+            tuple: Label, timestamps, metric names and values with one row
+            per metric, or None if nothing is cached
+        """
+        with self.connect() as db:
+            label = db.execute(
+                "SELECT label FROM resources WHERE resource_id = ?", (interface,)
+            ).fetchone()
+            rows = db.execute(
+                """SELECT rowid, metric, start, end, timestamps, vals FROM blocks
+                WHERE resource_id = ? AND step = ? AND end >= ? AND start <= ?
+                ORDER BY fetched""",
+                (interface, step, start, end),
+            ).fetchall()
+        blocks = {}
+        for row in rows:
+            if row[1] in metrics:
+                blocks.setdefault(row[1], []).append(row)
+        if label is None or not blocks:
+            return None
+
+        series = {}
+        for metric, metric_blocks in blocks.items():
+            timestamps = np.concatenate(
+                [np.frombuffer(row[4], dtype=np.int64) for row in metric_blocks]
+            )
+            values = np.concatenate(
+                [np.frombuffer(row[5], dtype=np.float64) for row in metric_blocks]
+            )
+            # Keep the most recently fetched value for repeated timestamps
+            timestamps, index = np.unique(timestamps[::-1], return_index=True)
+            series[metric] = (timestamps, values[::-1][index])
+            if len(metric_blocks) > COMPACT_BLOCKS:
+                self.compact(interface, metric, step, metric_blocks, series[metric])
+
+        names = [metric for metric in metrics if metric in series]
+        all_ts = np.unique(np.concatenate([series[name][0] for name in names]))
+        all_ts = all_ts[(all_ts >= start) & (all_ts <= end)]
+        values = np.full((len(names), len(all_ts)), np.nan)
+        for row, name in enumerate(names):
+            timestamps, metric_values = series[name]
+            keep = (timestamps >= start) & (timestamps <= end)
+            values[row, np.searchsorted(all_ts, timestamps[keep])] = metric_values[keep]
+        return label[0], all_ts, names, values
+
+    def compact(
+        self, interface: str, metric: str, step: int, blocks: list, series: tuple
+    ):
+        """Replace many small blocks with one block per continuous range
+
+        Args:
+            interface (str): Resource ID of interface
+            metric (str): Metric name
+            step (int): Step between timestamps
+            blocks (list): Stored block rows for the metric
+            series (tuple): Merged timestamps and values from the blocks
+        """
+        timestamps, values = series
+        fetched = int(time.time() * 1000)
+        rows = []
+        ranges = [(row[2], row[3]) for row in blocks if row[3] >= row[2]]
+        for start, end in merge_ranges(ranges):
+            keep = (timestamps >= start) & (timestamps <= end)
+            rows.append(
+                (
+                    interface,
+                    metric,
+                    step,
+                    start,
+                    end,
+                    fetched,
+                    timestamps[keep].tobytes(),
+                    values[keep].tobytes(),
+                )
+            )
+        with self.connect() as db:
+            if not self.current(db):
+                return
+            db.executemany(
+                "DELETE FROM blocks WHERE rowid = ?", [(row[0],) for row in blocks]
+            )
+            db.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def evict(self):
+        """Remove data older than the age limit, then oldest data over size limit"""
+        oldest = int((time.time() - self.days * 86400) * 1000)
+        with self.connect() as db:
+            db.execute("DELETE FROM blocks WHERE end < ?", (oldest,))
+            page_size = db.execute("PRAGMA page_size").fetchone()[0]
+            while True:
+                pages, free = [
+                    db.execute(f"PRAGMA {pragma}").fetchone()[0]
+                    for pragma in ["page_count", "freelist_count"]
+                ]
+                if (pages - free) * page_size <= self.size_mb * 1024 * 1024:
+                    break
+                # Drop the oldest tenth of blocks until under the size limit
+                deleted = db.execute("""DELETE FROM blocks WHERE rowid IN (
+                        SELECT rowid FROM blocks ORDER BY end
+                        LIMIT MAX((SELECT COUNT(*) FROM blocks) / 10, 1))""").rowcount
+                if not deleted:
+                    break
+            db.execute("""DELETE FROM resources WHERE resource_id NOT IN (
+                    SELECT resource_id FROM blocks)""")
+            db.commit()
+            db.execute("PRAGMA incremental_vacuum")
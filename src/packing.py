@@ -0,0 +1,299 @@
+# packing.py
+
+# Compact binary format for parsed metrics, decoded one entry at a time
+
+import io
+import pickle
+import struct
+from itertools import compress
+
+import numpy as np
+
+import timeseries
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Fewest rows in a dict before it is stored as columns
+TABLE_ROWS = 8
+# Byte boundary for arrays, so they can be used without copying
+ALIGN = 8
+
+# Compress and decompress functions for each codec that is installed
+CODECS = {"none": (bytes, bytes)}
+if zstandard:
+    CODECS["zstd"] = (zstandard.compress, zstandard.decompress)
+if lz4:
+    CODECS["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+
+# Marks keys missing from a row, as None is a valid value
+MISSING = object()
+
+
+def column_array(values: list):
+    """Convert column values to the smallest exact array
+
+    Args:
+        values (list): Values of one field, MISSING where a row lacks it
+
+    Returns:
+        np.ndarray: Float column with NaN for None, or integer column.
+        None if values are not all numbers.
+    """
+    kinds = set(map(type, values))
+    if int in kinds and kinds <= {int, object}:
+        try:
+            column = np.array(
+                [0 if value is MISSING else value for value in values], dtype=np.int64
+            )
+        except OverflowError:
+            return None
+        dtype = np.promote_types(
+            np.min_scalar_type(int(column.min())),
+            np.min_scalar_type(int(column.max())),
+        )
+        return column.astype(dtype)
+    if not kinds <= {float, np.float64, type(None), object}:
+        return None
+    if kinds <= {float, np.float64}:
+        column = np.array(values, dtype=np.float64)
+        gaps = 0
+    else:
+        column = np.array(values, dtype=object)
+        blank = np.equal(column, None) | np.equal(column, MISSING)
+        column[blank] = np.nan
+        column = column.astype(np.float64)
+        gaps = blank.sum()
+    # NaN values would come back as None
+    if np.isnan(column).sum() != gaps:
+        return None
+    small = column.astype(np.float32)
+    return small if np.array_equal(small, column, equal_nan=True) else column
+
+
+class Table:
+    """Dict of rows holding numbers, stored as one array per field
+
+    Rows may leave out fields, but must keep the order of the others, so
+    each row is rebuilt exactly as it was. Evenly spaced integer keys, such
+    as timestamps, are kept as a range, and a field repeating the key is
+    not stored.
+    """
+
+    def __init__(self, keys, names: list, columns: list, present) -> None:
+        self.keys = keys
+        self.names = names
+        self.columns = columns
+        self.present = present
+
+    @classmethod
+    def from_rows(cls, rows: dict) -> "Table":
+        """Store rows as columns, if they fit
+
+        Args:
+            rows (dict): Dicts of numbers, such as values for each timestamp
+
+        Returns:
+            Table: Rows as columns, or None if rows do not fit a table or
+            have no fields
+        """
+        values = list(rows.values())
+        if len(values) < TABLE_ROWS or set(map(type, values)) != {dict}:
+            return None
+        layouts = list(dict.fromkeys(map(tuple, values)))
+        names = list(dict.fromkeys(name for layout in layouts for name in layout))
+        # Rows without fields have no columns to rebuild their keys from
+        if not names:
+            return None
+        position = {name: number for number, name in enumerate(names)}
+        for layout in layouts:
+            places = [position[name] for name in layout]
+            if places != sorted(places):
+                return None
+
+        if len(layouts) == 1:
+            fields = list(zip(*map(dict.values, values)))
+            present = None
+        else:
+            fields = [[row.get(name, MISSING) for row in values] for name in names]
+            mask = np.array([[name in row for name in names] for row in values])
+            present = np.packbits(mask)
+        keys = list(rows)
+        if set(map(type, keys)) == {int}:
+            try:
+                keys = np.array(keys, dtype=np.int64)
+            except OverflowError:
+                pass
+        columns = []
+        for field in fields:
+            column = column_array(list(field))
+            if column is None:
+                return None
+            if (
+                present is None
+                and isinstance(keys, np.ndarray)
+                and np.array_equal(column, keys)
+            ):
+                column = None
+            columns.append(column)
+        if isinstance(keys, np.ndarray):
+            steps = np.diff(keys)
+            if steps[0] and (steps == steps[0]).all():
+                keys = range(int(keys[0]), int(keys[-1] + steps[0]), int(steps[0]))
+        return cls(keys, names, columns, present)
+
+    @staticmethod
+    def values(column: np.ndarray, keys) -> list:
+        """Convert a stored field back to values
+
+        Args:
+            column (np.ndarray): Stored field, None if it repeats the keys
+            keys: Row keys
+
+        Returns:
+            list: Value for each row, None for NaN
+        """
+        if column is None:
+            return keys
+        if column.dtype.kind == "f":
+            return timeseries.to_list(column.astype(np.float64))
+        return column.tolist()
+
+    def rows(self) -> dict:
+        """Rebuild rows
+
+        Returns:
+            dict: Dict of rows, as given to from_rows()
+        """
+        keys = self.keys.tolist() if isinstance(self.keys, np.ndarray) else self.keys
+        columns = [self.values(column, keys) for column in self.columns]
+        if self.present is None:
+            return {
+                key: dict(zip(self.names, row)) for key, row in zip(keys, zip(*columns))
+            }
+        mask = np.unpackbits(self.present, count=len(keys) * len(self.names))
+        flags = mask.reshape(len(keys), len(self.names)).astype(bool).tolist()
+        return {
+            key: dict(compress(zip(self.names, row), keep))
+            for key, row, keep in zip(keys, zip(*columns), flags)
+        }
+
+
+def encode(value):
+    """Replace dicts of numeric rows with tables
+
+    Args:
+        value: Part of parsed metrics
+
+    Returns:
+        Value with tables in place of dicts that fit them
+    """
+    if type(value) is not dict:
+        return value
+    table = Table.from_rows(value)
+    if table is not None:
+        return table
+    return {key: encode(item) for key, item in value.items()}
+
+
+def decode(value):
+    """Rebuild dicts from tables
+
+    Args:
+        value: Output of encode()
+
+    Returns:
+        Value as given to encode()
+    """
+    if isinstance(value, Table):
+        return value.rows()
+    if type(value) is not dict:
+        return value
+    return {key: decode(item) for key, item in value.items()}
+
+
+class ArrayPickler(pickle.Pickler):
+    """Pickler writing NumPy arrays to a separate list of buffers"""
+
+    def __init__(self, file, buffers: list) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.buffers = buffers
+
+    def persistent_id(self, obj):
+        if type(obj) is np.ndarray and obj.dtype.kind in "biuf":
+            self.buffers.append(np.ascontiguousarray(obj))
+            return (len(self.buffers) - 1, obj.dtype.str, obj.shape)
+        return None
+
+
+class ArrayUnpickler(pickle.Unpickler):
+    """Unpickler reading NumPy arrays from buffers, without copying them"""
+
+    def __init__(self, file, buffers: list) -> None:
+        super().__init__(file)
+        self.buffers = buffers
+
+    def persistent_load(self, pid):
+        number, dtype, shape = pid
+        return np.frombuffer(self.buffers[number], dtype=dtype).reshape(shape)
+
+
+def pack_entry(value, codec: str = "none") -> bytes:
+    """Serialize one entry of parsed metrics
+
+    Arrays are written after the rest of the entry, aligned so they can be
+    read back in place.
+
+    Args:
+        value: Entry of parsed metrics
+        codec (str, optional): Compression from CODECS. Defaults to "none".
+
+    Returns:
+        bytes: Packed entry
+    """
+    skeleton = io.BytesIO()
+    buffers = []
+    ArrayPickler(skeleton, buffers).dump(encode(value))
+    skeleton = skeleton.getvalue()
+    sizes = [len(skeleton)] + [buffer.nbytes for buffer in buffers]
+    head = struct.pack(f"<I{len(sizes)}Q", len(buffers), *sizes)
+    parts = [head, skeleton]
+    offset = len(head) + len(skeleton)
+    for buffer in buffers:
+        padding = -offset % ALIGN
+        parts += [b"\0" * padding, buffer.tobytes()]
+        offset += padding + buffer.nbytes
+    return CODECS[codec][0](b"".join(parts))
+
+
+def unpack_entry(data: memoryview, codec: str = "none"):
+    """Deserialize one entry of parsed metrics
+
+    Uncompressed arrays are used in place, without copying.
+
+    Args:
+        data (memoryview): Packed entry
+        codec (str, optional): Compression used to pack it. Defaults to "none".
+
+    Returns:
+        Entry of parsed metrics
+    """
+    if codec != "none":
+        data = memoryview(CODECS[codec][1](data))
+    (count,) = struct.unpack_from("<I", data)
+    sizes = struct.unpack_from(f"<{count + 1}Q", data, 4)
+    offset = 4 + 8 * (count + 1)
+    skeleton = data[offset : offset + sizes[0]]
+    offset += sizes[0]
+    buffers = []
+    for size in sizes[1:]:
+        offset += -offset % ALIGN
+        buffers.append(data[offset : offset + size])
+        offset += size
+    return decode(ArrayUnpickler(io.BytesIO(skeleton), buffers).load())
@@ -4,13 +4,114 @@
 
 import json
 import time
-from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+from threading import Lock
 
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+import measurements
+import metric_cache
+import spans
+import timeseries
+
+# Limits for combining interfaces into one Measurements query
+BATCH_SOURCES = 100
+BATCH_POINTS = 500000
+# Typical collection interval, used to estimate points returned for step=1
+RESOLUTION = 300000
+# Points for each source in one time chunk, two weeks at RESOLUTION
+CHUNK_POINTS = 4032
+# Most points requested for each source over the report range
+REPORT_POINTS = 10000
+# Steps used for long ranges, each fits evenly in an hour so every hour of
+# the week still gets data
+STEPS = [600000, 900000, 1200000, 1800000, timeseries.HOUR]
+
+# Most Measurements queries running at once for a collection
+MAX_IN_FLIGHT = 4
+
+# Local measurement cache location, age limit (days) and size limit (MB)
+CACHE_PATH = "cache/measurements.sqlite"
+CACHE_DAYS = 90
+CACHE_MB = 1024
+
+# VIPs kept in the ranking for each metric, 0 to keep all
+TOP_N = 25
+
+# Settings from config.json passed through to main()
+COLLECTION_OPTIONS = {
+    "batch_sources": BATCH_SOURCES,
+    "batch_points": BATCH_POINTS,
+    "max_in_flight": MAX_IN_FLIGHT,
+    "report_points": REPORT_POINTS,
+    "cache_path": CACHE_PATH,
+    "cache_days": CACHE_DAYS,
+    "cache_mb": CACHE_MB,
+    "top_n": TOP_N,
+}
+
+# Connection pooling and timeouts (seconds) for OpenNMS REST calls
+POOL_SIZE = 10
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+# Bytes of response body read at a time when streaming measurements
+STREAM_CHUNK = 262144
+
+# Settings from config.json passed through to configure_client()
+CLIENT_OPTIONS = {
+    "pool_size": POOL_SIZE,
+    "connect_timeout": CONNECT_TIMEOUT,
+    "read_timeout": READ_TIMEOUT,
+}
+
+
+def new_client(pool_size: int = POOL_SIZE) -> requests.Session:
+    """Create HTTP session that keeps connections open between requests
+
+    Args:
+        pool_size (int, optional): Connections kept open per host.
+        Defaults to POOL_SIZE.
+
+    Returns:
+        requests.Session: Session with pooled connections
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(
+        {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+    )
+    return session
+
+
+client = new_client()
+timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def configure_client(
+    pool_size: int = POOL_SIZE,
+    connect_timeout: int = CONNECT_TIMEOUT,
+    read_timeout: int = READ_TIMEOUT,
+) -> None:
+    """Replace shared HTTP session used for all OpenNMS REST calls
+
+    Args:
+        pool_size (int, optional): Connections kept open per host.
+        Defaults to POOL_SIZE.
+        connect_timeout (int, optional): Seconds to wait for a connection.
+        Defaults to CONNECT_TIMEOUT.
+        read_timeout (int, optional): Seconds to wait for a response.
+        Defaults to READ_TIMEOUT.
+    """
+    global client, timeout
+    client = new_client(pool_size)
+    timeout = (connect_timeout, read_timeout)
+
 
 def get_data(url: str, auth: HTTPBasicAuth) -> dict:
     """Retrieve data from OpenNMS API
@@ -24,7 +125,7 @@ def get_data(url: str, auth: HTTPBasicAuth) -> dict:
     """
     headers = {"Accept": "application/json"}
     print("Getting data from: " + url)
-    data = requests.get(url, auth=auth, headers=headers)
+    data = client.get(url, auth=auth, headers=headers, timeout=timeout)
     if data.status_code in [404]:
         return {"id": f'node[{url.split("fornode/")[1]}]',
                 'label': f'0.0.0.0 ({url.split("fornode/")[1]}-NotFound)',
@@ -34,45 +135,117 @@ def get_data(url: str, auth: HTTPBasicAuth) -> dict:
     return data.json()
 
 
-def post_data(url: str, auth: HTTPBasicAuth, payload: dict) -> dict:
+class Progress:
+    """Collection progress, reported to an optional callback"""
+
+    def __init__(self, interfaces: int, chunks: int, callback=None) -> None:
+        self.interfaces = interfaces
+        self.chunks = max(chunks, 1)
+        self.done = 0
+        self.bytes = 0
+        self.started = time.time()
+        self.callback = callback
+        self.lock = Lock()
+
+    def add_bytes(self, size: int):
+        """Count bytes received, safe to call from any thread
+
+        Args:
+            size (int): Size of response body
+        """
+        with self.lock:
+            self.bytes += size
+
+    def finished(self, chunks: int):
+        """Count interface time chunks that have been collected
+
+        Args:
+            chunks (int): Number of interface time chunks completed
+        """
+        self.done += chunks
+        self.report()
+
+    def report(self, phase: str = "collecting"):
+        """Send current progress to callback
+
+        Args:
+            phase (str, optional): Current step of the collection.
+            Defaults to "collecting".
+        """
+        if not self.callback:
+            return
+        fraction = min(self.done / self.chunks, 1)
+        elapsed = time.time() - self.started
+        self.callback(
+            {
+                "phase": phase,
+                "done": int(self.interfaces * fraction),
+                "total": self.interfaces,
+                "bytes": self.bytes,
+                "eta": elapsed / fraction * (1 - fraction) if fraction else None,
+            }
+        )
+
+
+def post_data(
+    url: str, auth: HTTPBasicAuth, payload: dict, progress: Progress = None
+) -> dict:
     """Post data to OpenNMS API
 
     Args:
         url (str): URL to OpenNMS API
         auth (HTTPBasicAuth): Authentication credentials
         payload (dict): Data to post
+        progress (Progress, optional): Progress to count bytes received.
+        Defaults to None.
 
     Returns:
-        dict: Raw API response
+        dict: Raw API response, with timestamps and values as NumPy arrays.
+        Error responses have no timestamps.
     """
     headers = {"Accept": "application/json", "Content-Type": "application/json"}
-    print(f"Getting data from: {url}/{payload['source'][0]['resourceId']}")
-    data = requests.post(url, auth=auth, headers=headers, data=json.dumps(payload))
-    return data.json()
-
-
-def blank_histogram() -> dict:
-    """Generate default dict for interface
-
-    Returns:
-        dict: Blank interface template
-    """
-    blank = {"ts": {}, "summary": {}}
-    blank["day_of_week"] = {
-        0: {"total": {}},
-        1: {"total": {}},
-        2: {"total": {}},
-        3: {"total": {}},
-        4: {"total": {}},
-        5: {"total": {}},
-        6: {"total": {}},
-    }
-    blank["hour_of_day"] = {}
-    for hour in range(0, 24):
-        blank["hour_of_day"][hour] = {}
-        for day in range(0, 7):
-            blank["day_of_week"][day][hour] = {}
-    return blank
+    resources = len(set(source["resourceId"] for source in payload["source"]))
+    print(
+        f"Getting data from: {url}/{payload['source'][0]['resourceId']}"
+        f" ({resources} resources)"
+    )
+    with spans.span("measurements"), client.post(
+        url,
+        auth=auth,
+        headers=headers,
+        data=json.dumps(payload),
+        timeout=timeout,
+        stream=True,
+    ) as data:
+        if data.status_code != 200:
+            if progress:
+                progress.add_bytes(len(data.content))
+            print(f"Measurements request failed with status {data.status_code}")
+            try:
+                return data.json()
+            except ValueError:
+                # Error pages may be HTML or empty instead of JSON
+                return {"error": data.text}
+        # Parse values into arrays as they arrive instead of building lists
+        decoder = measurements.MeasurementsDecoder()
+        size = 0
+        parsing = 0.0
+        for chunk in data.iter_content(chunk_size=STREAM_CHUNK):
+            start = time.perf_counter()
+            decoder.feed(chunk)
+            parsing += time.perf_counter() - start
+            size += len(chunk)
+            if progress:
+                progress.add_bytes(len(chunk))
+        start = time.perf_counter()
+        metric_data = decoder.result()
+        spans.observe("span_seconds", "parse", parsing + time.perf_counter() - start)
+    points = len(metric_data.get("timestamps", [])) * len(
+        metric_data.get("columns", [])
+    )
+    spans.observe("measurements_bytes", "measurements", size)
+    spans.observe("measurements_points", "measurements", points)
+    return metric_data
 
 
 def average_metrics(metrics: dict) -> dict:
@@ -100,67 +273,62 @@ def average_metrics(metrics: dict) -> dict:
     return metrics
 
 
-def average_lists(parsed_metrics: dict) -> dict:
-    """Calculate average data for provided metrics
+@spans.timed("top_n_stats")
+def vip_names(parsed_metrics: dict) -> list:
+    """List VIPs collected, without their partition
 
     Args:
-        parsed_metrics (dict): Dict of interface with lists of collected metrics
+        parsed_metrics (dict): Collected metrics for all interfaces
 
     Returns:
-        dict: Dict of interface with averaged metrics
+        list: VIP names
     """
-    if parsed_metrics.get("ts"):
-        for ts in parsed_metrics["ts"]:
-            parsed_metrics["ts"][ts] = average_metrics(parsed_metrics["ts"][ts])
-    if parsed_metrics.get("hour_of_day"):
-        for hour in range(0, 24):
-            parsed_metrics["hour_of_day"][hour] = average_metrics(
-                parsed_metrics["hour_of_day"][hour]
-            )
-            for day in range(0, 7):
-                parsed_metrics["day_of_week"][day][hour] = average_metrics(
-                    parsed_metrics["day_of_week"][day][hour]
-                )
-                parsed_metrics["day_of_week"][day]["total"] = average_metrics(
-                    parsed_metrics["day_of_week"][day]["total"]
-                )
-    if parsed_metrics.get("summary"):
-        parsed_metrics["summary"] = average_metrics(parsed_metrics["summary"])
-    return parsed_metrics
+    return [vip.replace("/Common/", "") for vip in parsed_metrics if "/Common/" in vip]
 
 
-def top_n_stats(parsed_metrics: dict) -> dict:
+def top_n_stats(parsed_metrics: dict, count: int = TOP_N) -> dict:
     """Generate Top N stats for all VIPs collected
 
     Args:
         parsed_metrics (dict): Collected metrics for all interfaces
+        count (int, optional): VIPs to keep for each metric, 0 for all.
+        Defaults to TOP_N.
 
     Returns:
         dict: TopN data for all interfaces
     """
-    top_n = {}
-    trimmed_n = {}
+    vips = [interface for interface in parsed_metrics if "node[" not in interface]
+    metrics = {}
+    for vip in vips:
+        for metric in parsed_metrics[vip]["summary"]:
+            metrics.setdefault(metric, len(metrics))
+    values = np.full((len(metrics), len(vips)), np.nan)
+    for column, vip in enumerate(vips):
+        for metric, value in parsed_metrics[vip]["summary"].items():
+            if value is not None:
+                values[metrics[metric], column] = value
+
     sorted_top_n = {}
-    for interface in parsed_metrics:
-        if "node[" not in interface:
-            for metric in parsed_metrics[interface]["summary"]:
-                if top_n.get(metric):
-                    top_n[metric][interface] = parsed_metrics[interface]["summary"][
-                        metric
-                    ]
-                else:
-                    top_n[metric] = {
-                        interface: parsed_metrics[interface]["summary"][metric]
-                    }
-    for metric in top_n:
-        trimmed_n[metric] = {}
-        for vip in top_n[metric]:
-            if round(top_n[metric][vip] or 0, 2) not in [None, 0]:
-                trimmed_n[metric][vip] = top_n[metric][vip]
-        d = Counter(trimmed_n[metric])
-        sorted_top_n[metric] = {}
-        for k, v in d.most_common():
-            sorted_top_n[metric][k] = v
+    for metric, row in metrics.items():
+        # Skip VIPs with no data or an average that rounds to 0
+        magnitude = np.abs(values[row])
+        keep = np.flatnonzero(magnitude >= 0.01)
+        small = np.flatnonzero(magnitude < 0.01)
+        keep = np.union1d(keep, [i for i in small if round(values[row, i], 2) != 0])
+        keep = keep.astype(np.int64)
+        ranked = values[row, keep]
+        if count and len(keep) > count:
+            # Keep ties with the K-th value in collection order, like sorting
+            cutoff = -np.partition(-ranked, count - 1)[count - 1]
+            above = np.flatnonzero(ranked > cutoff)
+            tied = np.flatnonzero(ranked == cutoff)[: count - len(above)]
+            chosen = np.union1d(above, tied)
+            keep, ranked = keep[chosen], ranked[chosen]
+        order = np.lexsort((keep, -ranked))
+        sorted_top_n[metric] = {
+            vips[column]: parsed_metrics[vips[column]]["summary"][metric]
+            for column in keep[order].tolist()
+        }
     return sorted_top_n
 
 
@@ -186,146 +354,291 @@ def device_stats(parsed_metrics: dict) -> dict:
     return device
 
 
-def add_metrics(  # noqa C901
+def choose_step(start: int, end: int, report_points: int = REPORT_POINTS) -> int:
+    """Pick step for Measurements queries so long ranges return fewer points
+
+    Args:
+        start (int): Timestamp for start of range
+        end (int): Timestamp for end of range
+        report_points (int, optional): Most points wanted for each source,
+        0 for no limit. Defaults to REPORT_POINTS.
+
+    Returns:
+        int: Step in milliseconds, 1 for the finest resolution stored
+    """
+    if not report_points or (end - start) / RESOLUTION <= report_points:
+        return 1
+    for step in STEPS:
+        if (end - start) / step <= report_points:
+            return step
+    return STEPS[-1]
+
+
+def plan_batches(
+    interfaces: list,
+    metrics: list,
+    start: int,
+    end: int,
+    step: int = 1,
+    max_sources: int = BATCH_SOURCES,
+    max_points: int = BATCH_POINTS,
+    resolution: int = RESOLUTION,
+) -> list:
+    """Group interfaces so each Measurements query stays within budget
+
+    Args:
+        interfaces (list): Interfaces to collect
+        metrics (list): Metrics to request for each interface
+        start (int): Timestamp for start of data to request
+        end (int): Timestamp for end of data to request
+        step (int, optional): Step between timestamps to request. Defaults to 1.
+        max_sources (int, optional): Most sources in one query.
+        Defaults to BATCH_SOURCES.
+        max_points (int, optional): Most data points expected from one query.
+        Defaults to BATCH_POINTS.
+        resolution (int, optional): Expected milliseconds between points
+        returned. Defaults to RESOLUTION.
+
+    Returns:
+        list: Lists of interfaces to request together
+    """
+    sources = max(len(metrics), 1)
+    points = sources * (int((end - start) / max(step, resolution)) + 1)
+    size = max(min(max_sources // sources, max_points // points), 1)
+    return [interfaces[i : i + size] for i in range(0, len(interfaces), size)]
+
+
+class QueryPlanner:
+    """Measurements queries handed out one at a time, sized from responses
+
+    Time ranges are cut into chunks of about CHUNK_POINTS points for each
+    source, and interfaces grouped to stay within the query budget. Both use
+    the smallest interval between points seen in responses so far, so later
+    queries follow the resolution OpenNMS actually returns. Until the first
+    response arrives only one query should be in flight.
+    """
+
+    def __init__(
+        self,
+        ranges: dict,
+        metrics: list,
+        step: int = 1,
+        max_sources: int = BATCH_SOURCES,
+        max_points: int = BATCH_POINTS,
+    ) -> None:
+        self.ranges = [
+            [start, end, interfaces] for (start, end), interfaces in ranges.items()
+        ]
+        self.metrics = metrics
+        self.step = step
+        self.max_sources = max_sources
+        self.max_points = max_points
+        self.resolution = max(step, RESOLUTION)
+        self.observed = None
+        self.answered = 0
+        self.batch = None
+        self.waiting = []
+
+    def next(self) -> tuple:
+        """Get the next query to send
+
+        Returns:
+            tuple: Interfaces and time range to request, or None when done
+        """
+        if not self.waiting:
+            if not self.ranges:
+                return None
+            start, end, interfaces = self.ranges[0]
+            chunk_end = min(start + CHUNK_POINTS * self.resolution, end)
+            if chunk_end >= end:
+                self.ranges.pop(0)
+            else:
+                self.ranges[0][0] = chunk_end + 1
+            self.batch = (start, chunk_end)
+            self.waiting = list(interfaces)
+        group = plan_batches(
+            self.waiting,
+            self.metrics,
+            self.batch[0],
+            self.batch[1],
+            self.step,
+            self.max_sources,
+            self.max_points,
+            self.resolution,
+        )[0]
+        self.waiting = self.waiting[len(group) :]
+        return group, self.batch
+
+    def observe(self, batch: tuple, responses: dict):
+        """Update expected resolution from a query's responses
+
+        Args:
+            batch (tuple): Time range requested
+            responses (dict): Single interface response for each interface
+        """
+        self.answered += 1
+        for response in responses.values():
+            timestamps = response.get("timestamps")
+            if timestamps is not None and len(timestamps) > 1:
+                interval = max((batch[1] - batch[0]) // len(timestamps), 1)
+                self.observed = min(self.observed or interval, interval)
+                self.resolution = max(self.step, self.observed)
+                return
+
+
+def split_response(metric_data: dict, sources: dict) -> dict:
+    """Split a multi-interface Measurements response by interface
+
+    Args:
+        metric_data (dict): Raw API response
+        sources (dict): Interface and metric for each source label
+
+    Returns:
+        dict: Single interface response for each interface
+    """
+    resources = metric_data.get("metadata", {}).get("resources", [])
+    by_id = {resource.get("id"): resource for resource in resources}
+    split = {}
+    for z in range(0, len(metric_data.get("columns", []))):
+        interface, metric = sources[metric_data["labels"][z]]
+        if interface not in split:
+            resource = by_id.get(interface) or resources[min(z, len(resources) - 1)]
+            split[interface] = {
+                "timestamps": metric_data["timestamps"],
+                "labels": [],
+                "columns": [],
+                "metadata": {"resources": [resource]},
+            }
+        split[interface]["labels"].append(metric)
+        split[interface]["columns"].append(metric_data["columns"][z])
+    return split
+
+
+def fetch_metrics(
     url: str,
-    interface: str,
-    parsed_metrics: dict,
+    interfaces: list,
     auth: HTTPBasicAuth,
     metrics: list,
     start: int,
     end: int = 0,
     step: int = 1,
+    progress: Progress = None,
 ) -> dict:
-    """Add metrics to collected data for specific VIP
+    """Request metrics for a group of VIPs in one query
 
     Args:
         url (str): URL to OpenNMS API
-        interface (str): Interface name to collect
-        parsed_metrics (dict): Previously collected metrics
+        interfaces (list): Interface names to collect in one request
         auth (HTTPBasicAuth): Authentication credentials
         metrics (list): List of metrics to request
         start (int): Timestamp for start of data to request
         end (int): Timestamp for end of data to request
         step (int, optional): Step between timestamps to request. Defaults to 1.
+        progress (Progress, optional): Progress to count bytes received.
+        Defaults to None.
 
     Returns:
-        dict: Previously collected metrics with new metrics added
+        dict: Single interface response for each interface
     """
     payload = {"start": start, "end": end, "step": step, "source": [], "expression": []}
-    for metric in metrics:
-        if "in" in metric.lower():
+    sources = {}
+    for number, interface in enumerate(interfaces):
+        for metric in metrics:
+            label = f"{metric}_{number}"
+            sources[label] = (interface, metric)
             payload["source"].append(
                 {
                     "aggregation": "AVERAGE",
                     "attribute": metric,
-                    "label": metric,
+                    "label": label,
                     "resourceId": interface,
                     "transient": "false",
                 }
             )
-            # payload['expression'].append({
-            #     "label": f"{metric}Neg",
-            #     "value": f"-1.0 * {metric}",
-            #     "transient": "false"
-            # })
-        else:
-            payload["source"].append(
-                {
-                    "aggregation": "AVERAGE",
-                    "attribute": metric,
-                    "label": metric,
-                    "resourceId": interface,
-                    "transient": "false",
-                }
+
+    metric_data = post_data(url, auth=auth, payload=payload, progress=progress)
+    if "timestamps" not in metric_data and len(interfaces) > 1:
+        # Retry in halves so one bad resource does not lose the whole group
+        half = len(interfaces) // 2
+        responses = {}
+        for group in [interfaces[:half], interfaces[half:]]:
+            responses.update(
+                fetch_metrics(url, group, auth, metrics, start, end, step, progress)
             )
+        return responses
+    return split_response(metric_data, sources)
 
-    metric_data = post_data(url, auth=auth, payload=payload)
-
-    # Loop through each timestamp and metric to group data based on day/hour
-    for i in range(0, len(metric_data["timestamps"])):
-        ts = metric_data["timestamps"][i]
-        date = datetime.fromtimestamp(ts / 1000)
-        hour = date.hour
-        day = date.weekday()
-        for z in range(0, len(metric_data["columns"])):
-            column = metric_data["columns"][z]["values"][i]
-            if column == "NaN":
-                column = None
-
-            data_point = metric_data["metadata"]["resources"][z]["label"]
-            parsed_metrics[interface]["label"] = data_point
-            metric = metric_data["labels"][z]
-
-            if parsed_metrics[interface]["ts"].get(ts):
-                parsed_metrics[interface]["ts"][ts][metric] = column
-                parsed_metrics[interface]["ts"][ts]["timestamp"] = ts
-                parsed_metrics[interface]["ts"][ts]["day"] = day
-            else:
-                parsed_metrics[interface]["ts"][ts] = {
-                    metric: column,
-                    "timestamp": ts,
-                    "day": day,
-                }
 
-            for label in [data_point, "node[device]"]:
-                if not parsed_metrics.get(label):
-                    parsed_metrics[label] = blank_histogram()
+def add_metrics(
+    url: str,
+    interfaces: list,
+    store: timeseries.MetricStore,
+    auth: HTTPBasicAuth,
+    metrics: list,
+    start: int,
+    end: int = 0,
+    step: int = 1,
+) -> timeseries.MetricStore:
+    """Add metrics to collected data for a group of VIPs
 
-                if parsed_metrics[label]["ts"].get(ts):
-                    if parsed_metrics[label]["ts"][ts].get(metric):
-                        parsed_metrics[label]["ts"][ts][metric].append(
-                            parsed_metrics[interface]["ts"][ts][metric]
-                        )
-                    else:
-                        parsed_metrics[label]["ts"][ts][metric] = [
-                            parsed_metrics[interface]["ts"][ts][metric]
-                        ]
-                else:
-                    parsed_metrics[label]["ts"][ts] = {
-                        metric: [parsed_metrics[interface]["ts"][ts][metric]]
-                    }
-
-                if parsed_metrics[label]["day_of_week"][day]["total"].get(metric):
-                    parsed_metrics[label]["day_of_week"][day]["total"][metric].append(
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    )
-                else:
-                    parsed_metrics[label]["day_of_week"][day]["total"][metric] = [
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    ]
-
-                if parsed_metrics[label]["hour_of_day"][hour].get(metric):
-                    parsed_metrics[label]["hour_of_day"][hour][metric].append(
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    )
-                    if parsed_metrics[label]["day_of_week"][day][hour].get(metric):
-                        parsed_metrics[label]["day_of_week"][day][hour][metric].append(
-                            parsed_metrics[interface]["ts"][ts][metric]
-                        )
-                    else:
-                        parsed_metrics[label]["day_of_week"][day][hour][metric] = [
-                            parsed_metrics[interface]["ts"][ts][metric]
-                        ]
-                else:
-                    parsed_metrics[label]["hour_of_day"][hour][metric] = [
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    ]
-                    parsed_metrics[label]["day_of_week"][day][hour][metric] = [
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    ]
-
-                if parsed_metrics[label]["summary"].get(metric):
-                    parsed_metrics[label]["summary"][metric].append(
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    )
-                else:
-                    parsed_metrics[label]["summary"][metric] = [
-                        parsed_metrics[interface]["ts"][ts][metric]
-                    ]
+    Args:
+        url (str): URL to OpenNMS API
+        interfaces (list): Interface names to collect in one request
+        store (timeseries.MetricStore): Previously collected metrics
+        auth (HTTPBasicAuth): Authentication credentials
+        metrics (list): List of metrics to request
+        start (int): Timestamp for start of data to request
+        end (int): Timestamp for end of data to request
+        step (int, optional): Step between timestamps to request. Defaults to 1.
 
-    # parsed_metrics[label]['ts'] = dict(collections.OrderedDict(sorted(parsed_metrics[label]['ts'].items())))
+    Returns:
+        timeseries.MetricStore: Previously collected metrics with new metrics added
+    """
+    responses = fetch_metrics(url, interfaces, auth, metrics, start, end, step)
+    for interface in interfaces:
+        store.add_response(interface, responses.get(interface, {}))
+    return store
 
-    return parsed_metrics
+
+def config_options(config: dict, defaults: dict) -> dict:
+    """Read optional settings from config
+
+    Args:
+        config (dict): Application settings
+        defaults (dict): Default value for each optional setting
+
+    Returns:
+        dict: Settings found in config, converted to the type of their default
+    """
+    options = {}
+    for option, default in defaults.items():
+        if config.get(option) not in [None, ""]:
+            options[option] = type(default)(config[option])
+    return options
+
+
+def collection_options(config: dict) -> dict:
+    """Read optional collection settings from config
+
+    Args:
+        config (dict): Application settings
+
+    Returns:
+        dict: Keyword arguments for main()
+    """
+    return config_options(config, COLLECTION_OPTIONS)
+
+
+def client_options(config: dict) -> dict:
+    """Read optional connection settings from config
+
+    Args:
+        config (dict): Application settings
+
+    Returns:
+        dict: Keyword arguments for configure_client()
+    """
+    return config_options(config, CLIENT_OPTIONS)
 
 
 def main(  # noqa C901
@@ -335,6 +648,16 @@ def main(  # noqa C901
     metric_labels: list = [],
     data_start: int = None,
     data_end: int = None,
+    batch_sources: int = BATCH_SOURCES,
+    batch_points: int = BATCH_POINTS,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    report_points: int = REPORT_POINTS,
+    cache_path: str = CACHE_PATH,
+    cache_days: int = CACHE_DAYS,
+    cache_mb: int = CACHE_MB,
+    top_n: int = TOP_N,
+    progress=None,
+    profile=None,
 ) -> dict:
     start_time = time.time()
     generated = datetime.now()
@@ -345,12 +668,9 @@ def main(  # noqa C901
     minute = 60000
     hour = minute * 60
     day = hour * 24
-    week = day * 7
     month = day * 30
-    step = 1
     loop_count = 0
 
-    # Generate time ranges to get data in no more than two week chunks, to ensure smaller step size
     if not data_start or data_start <= 0:
         data_start = (int(start_time) * 1000) - month
         parsed_metrics["node[data]"]["range"]["start"] = generated - timedelta(days=30)
@@ -369,61 +689,111 @@ def main(  # noqa C901
     if data_start >= data_end:
         data_start = month * -1
         data_end = 0
-
-    batch_start = data_start
-    batch_end = data_start + (week * 2)
-    if batch_end >= data_end:
-        batch_end = data_end
-
-    batches = []
-    if (data_end - data_start) > (week * 2):
-        for i in range(0, int((data_end - data_start) / (week * 2)) + 1):
-            if i > 0:
-                batch_start = batch_end + 1
-                batch_end = batch_start + (week * 2)
-
-                if batch_end >= data_end:
-                    batch_end = data_end
-
-            batches.append((batch_start, batch_end))
-    else:
-        batches.append((batch_start, batch_end))
+    # Long ranges ask OpenNMS for averages over a longer step
+    step = choose_step(data_start, data_end, report_points)
+    parsed_metrics["node[data]"]["step"] = step
+
+    # Only fetch time ranges not already in the local cache
+    cache = None
+    if cache_days > 0 and cache_path and data_start > 0:
+        cache = metric_cache.MetricCache(cache_path, cache_days, cache_mb, base_url)
+    ranges = {}
+    for interface in interfaces:
+        if cache:
+            missing = cache.missing(
+                interface, metric_labels, step, data_start, data_end
+            )
+        else:
+            missing = [(data_start, data_end)]
+        for gap in missing:
+            ranges.setdefault(gap, []).append(interface)
 
     # Get data for each interface
+    store = timeseries.MetricStore(metric_labels)
+    metric_url = f"{base_url}measurements"
     for interface in interfaces:
         loop_count += 1
         # if loop_count > 10:  # break for testing to reduce processing time
         #    break
-        parsed_metrics[interface] = {"ts": {}}
-
-        metric_url = f"{base_url}measurements"
-
-        for batch in batches:
-            parsed_metrics = add_metrics(
-                metric_url,
-                interface,
-                parsed_metrics,
-                auth,
-                metric_labels,
-                batch[0],
-                batch[1],
-                step,
-            )
+        store.add_interface(interface)
 
-    # Summarize collected data
-    for interface in parsed_metrics:
-        if "node[" not in interface:
-            parsed_metrics[interface] = average_lists(parsed_metrics[interface])
-            parsed_metrics[interface]["stats"] = summary_stats(
-                parsed_metrics, interface, metric_labels
+    planner = QueryPlanner(ranges, metric_labels, step, batch_sources, batch_points)
+    tracker = Progress(
+        len(interfaces), sum(len(group) for group in ranges.values()), progress
+    )
+    collected = {}
+    with ThreadPoolExecutor(max_workers=max(max_in_flight, 1)) as executor:
+        running = {}
+        while True:
+            # Plan each query when it is sent, using responses received so far
+            limit = max(max_in_flight, 1) if planner.answered else 1
+            while len(running) < limit:
+                query = planner.next()
+                if not query:
+                    break
+                group, batch = query
+                future = executor.submit(
+                    fetch_metrics,
+                    metric_url,
+                    group,
+                    auth,
+                    metric_labels,
+                    batch[0],
+                    batch[1],
+                    step,
+                    tracker,
+                )
+                running[future] = query
+            if not running:
+                break
+            for future in wait(running, return_when=FIRST_COMPLETED).done:
+                group, batch = running.pop(future)
+                responses = future.result()
+                planner.observe(batch, responses)
+                for interface in group:
+                    if cache:
+                        cache.save(
+                            interface,
+                            step,
+                            batch,
+                            responses.get(interface, {}),
+                            int(start_time * 1000),
+                        )
+                    else:
+                        collected[(batch, interface)] = responses.get(interface, {})
+                tracker.finished(len(group))
+
+    # Store responses in time and interface order, like a serial collection
+    order = {interface: number for number, interface in enumerate(interfaces)}
+    for batch, interface in sorted(collected, key=lambda key: (key[0], order[key[1]])):
+        store.add_response(interface, collected.pop((batch, interface)))
+
+    if cache:
+        for interface in interfaces:
+            cached = cache.load(interface, metric_labels, step, data_start, data_end)
+            if cached:
+                store.add_values(interface, *cached)
+        cache.evict()
+    if profile:
+        profile.mark("collection")
+
+    # Summarize collected data, already averaged by the store
+    tracker.report("summarizing")
+    with spans.span("aggregation"):
+        parsed_metrics.update(
+            store.build(
+                stats=metric_labels, progress=lambda: tracker.report("summarizing")
             )
+        )
 
-    parsed_metrics["node[top_n]"] = top_n_stats(parsed_metrics)
+    parsed_metrics["node[top_n]"] = top_n_stats(parsed_metrics, top_n)
+    parsed_metrics["node[data]"]["top_n"] = top_n
     parsed_metrics["node[device]"] = device_stats(parsed_metrics)
-    parsed_metrics["node[device]"] = average_lists(parsed_metrics["node[device]"])
     parsed_metrics["node[device]"]["stats"] = summary_stats(
         parsed_metrics, "node[device]", metric_labels
     )
+    if profile:
+        profile.mark("aggregation")
 
     end_time = time.time()
     parsed_metrics["node[data]"]["elapsed"] = end_time - start_time
@@ -471,6 +841,7 @@ def filter_interfaces(interface_list: dict) -> list:
     return interfaces, metrics
 
 
+@spans.timed("summary_stats")
 def summary_stats(parsed_metrics: dict, interface: str, metrics: list) -> dict:
     """Calculate summary statistics for provided interface
 
@@ -482,25 +853,18 @@ def summary_stats(parsed_metrics: dict, interface: str, metrics: list) -> dict:
     Returns:
         dict: Dict of summary stats for provided interface
     """
-    summary = {}
-    raw = {}
-
     if interface == "node[device]":
         raw = parsed_metrics[interface]
         for metric in metrics:
             raw[metric] = [item for item in raw[metric] if item is not None]
+        width = max([len(raw[metric]) for metric in metrics] + [0])
+        values = np.full((len(metrics), width), np.nan)
+        for row, metric in enumerate(metrics):
+            values[row, : len(raw[metric])] = raw[metric]
     else:
-        for metric in metrics:
-            raw[metric] = []
-            for ts in parsed_metrics[interface]["ts"]:
-                raw[metric].append(parsed_metrics[interface]["ts"][ts].get(metric))
-            raw[metric] = [item for item in raw[metric] if item is not None]
-
-    for metric in metrics:
-        summary[metric] = {}
-        summary[metric]["Min"] = np.min(raw[metric] or [0])
-        summary[metric]["Max"] = np.max(raw[metric] or [0])
-        summary[metric]["Average"] = np.mean(raw[metric] or [0])
-        summary[metric]["Total"] = np.sum(raw[metric] or [0])
-
-    return summary
+        points = parsed_metrics[interface]["ts"].values()
+        values = np.array(
+            [[point.get(metric) for point in points] for metric in metrics],
+            dtype=np.float64,
+        )
+    return timeseries.summary_table(values, metrics)
@@ -0,0 +1,188 @@
+# renderer.py
+
+# Chart images rendered in memory by a kaleido process kept running per worker
+
+import hashlib
+import time
+from threading import Lock
+
+import plotly
+import plotly.io
+
+import spans
+import sqlite_store
+
+# Size of chart images in pixels
+WIDTH = 1350
+HEIGHT = 600
+
+PATH = "cache/figures.sqlite"
+# Most space used by cached images (MB)
+SIZE_MB = 512
+
+# Settings from config.json used by open_cache()
+FIGURE_OPTIONS = {
+    "figure_mb": SIZE_MB,
+}
+
+# Figures rendered, seconds spent and images reused by this process
+stats = {"figures": 0, "seconds": 0.0, "cached": 0}
+stats_lock = Lock()
+
+
+def figure_key(figure, width: int, height: int) -> str:
+    """Generate cache key for a rendered figure
+
+    Args:
+        figure (plotly.graph_objects.Figure): Figure to render
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+
+    Returns:
+        str: Cache key
+    """
+    spec = plotly.io.to_json(figure, validate=False)
+    key = f"{plotly.__version__}:{width}x{height}:{spec}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class FigureCache(sqlite_store.Store):
+    """PNG images in SQLite keyed by figure and size, with LRU eviction"""
+
+    def __init__(self, path: str = PATH, size_mb: int = SIZE_MB) -> None:
+        super().__init__(path)
+        self.size_mb = size_mb
+        with self.connect() as db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS images (
+                    key TEXT PRIMARY KEY,
+                    accessed REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                )"""
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS images_accessed ON images (accessed)"
+            )
+
+    def load(self, keys: list) -> dict:
+        """Get cached images
+
+        Args:
+            keys (list): Cache keys from figure_key()
+
+        Returns:
+            dict: PNG data for each key found
+        """
+        with self.connect() as db:
+            found = {}
+            for key in keys:
+                row = db.execute(
+                    "SELECT data FROM images WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    found[key] = row[0]
+            db.executemany(
+                "UPDATE images SET accessed = ? WHERE key = ?",
+                [(time.time(), key) for key in found],
+            )
+        return found
+
+    def save(self, images: dict):
+        """Add images to cache and evict least recently used ones over size limit
+
+        Args:
+            images (dict): PNG data for each cache key
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                [(key, now, len(data), data) for key, data in images.items()],
+            )
+            limit = self.size_mb * 1024 * 1024
+            (total,) = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM images"
+            ).fetchone()
+            for key, size in db.execute(
+                "SELECT key, size FROM images ORDER BY accessed"
+            ).fetchall():
+                if total <= limit:
+                    break
+                if key not in images:
+                    db.execute("DELETE FROM images WHERE key = ?", (key,))
+                    total -= size
+
+
+def open_cache(config: dict) -> FigureCache:
+    """Open figure image cache using settings from config
+
+    Args:
+        config (dict): Application settings
+
+    Returns:
+        FigureCache: Shared image cache, or None if disabled
+    """
+    return sqlite_store.open_store(
+        FigureCache, PATH, config, FIGURE_OPTIONS, enable="figure_mb"
+    )
+
+
+def render_png(
+    figures: list,
+    width: int = WIDTH,
+    height: int = HEIGHT,
+    cache: FigureCache = None,
+) -> list:
+    """Render a batch of figures to PNG images
+
+    Kaleido starts its renderer on first use and keeps it running, so later
+    batches only pay for the rendering itself. Figures already in the cache
+    are not rendered again.
+
+    Args:
+        figures (list): Plotly figures
+        width (int, optional): Image width in pixels. Defaults to WIDTH.
+        height (int, optional): Image height in pixels. Defaults to HEIGHT.
+        cache (FigureCache, optional): Cache of rendered images.
+        Defaults to None.
+
+    Returns:
+        list: PNG data for each figure
+    """
+    keys = [figure_key(figure, width, height) for figure in figures] if cache else []
+    found = cache.load(keys) if cache else {}
+    start = time.perf_counter()
+    images = []
+    rendered = {}
+    reused = 0
+    for i, figure in enumerate(figures):
+        if keys and keys[i] in found:
+            images.append(found[keys[i]])
+            reused += 1
+            continue
+        with spans.span("render"):
+            images.append(
+                plotly.io.to_image(figure, format="png", width=width, height=height)
+            )
+        if keys:
+            rendered[keys[i]] = images[-1]
+    with stats_lock:
+        stats["figures"] += len(figures) - reused
+        stats["seconds"] += time.perf_counter() - start
+        stats["cached"] += reused
+    if rendered:
+        cache.save(rendered)
+    return images
+
+
+def throughput() -> float:
+    """Average rendering speed of this process
+
+    Returns:
+        float: Figures rendered per second, 0 if none yet
+    """
+    with stats_lock:
+        if not stats["seconds"]:
+            return 0.0
+        return stats["figures"] / stats["seconds"]
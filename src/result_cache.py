@@ -0,0 +1,320 @@
+# result_cache.py
+
+# Collected pair data shared between users and workers
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections.abc import Mapping
+from functools import partial
+
+import packing
+import ra_processing
+import sqlite_store
+
+PATH = "cache/results.sqlite"
+# Seconds a result can be reused, and total size kept (MB)
+TTL = 900
+SIZE_MB = 2048
+# Compression of stored results, from packing.CODECS
+COMPRESSION = "none"
+# Fields of large entries kept in the pair index, as pages listing or ranking
+# VIPs read them for every VIP
+INDEX_FIELDS = ("summary", "stats", "label")
+# Largest packed entry kept whole in the pair index, instead of its own shard
+INDEX_BYTES = 16384
+
+# Schema of the database, stored as its user_version
+VERSION = 1
+
+# Settings from config.json used by open_cache()
+RESULT_OPTIONS = {
+    "result_ttl": TTL,
+    "result_mb": SIZE_MB,
+    "result_compression": COMPRESSION,
+}
+
+
+def result_key(config: dict, pair: list, start: int, end: int, metrics: list) -> str:
+    """Generate cache key for a collection
+
+    Args:
+        config (dict): Application settings, for the server and the collection
+        settings that change the data collected
+        pair (list): Nodes in the pair
+        start (int): Timestamp for start of data, None for default range
+        end (int): Timestamp for end of data, None for default range
+        metrics (list): Metrics collected
+
+    Returns:
+        str: Cache key
+    """
+    options = ra_processing.collection_options(config)
+    settings = [options.get(option) for option in ["report_points", "top_n"]]
+    key = json.dumps(
+        [config.get("url"), list(pair), start, end, sorted(metrics), settings]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResultExpired(Exception):
+    """Collected data was evicted from the result cache while in use"""
+
+
+class Entry(Mapping):
+    """Entry of parsed metrics, such as a VIP, read from its shard when needed
+
+    Fields kept in the pair index are used without reading the shard.
+    """
+
+    def __init__(self, fields: list, indexed: dict, load) -> None:
+        self.fields = fields
+        self.indexed = indexed
+        self.load = load
+        self.shard = None
+
+    def __getitem__(self, field):
+        if field in self.indexed:
+            return self.indexed[field]
+        if field not in self.fields:
+            raise KeyError(field)
+        if self.shard is None:
+            self.shard = self.load()
+        return self.shard[field]
+
+    def __contains__(self, field) -> bool:
+        return field in self.fields
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+
+class ShardedResult(Mapping):
+    """Parsed metrics from the result cache, reading each shard when first used
+
+    Pages only use a few VIPs, so loading time and memory do not grow with
+    the VIPs in the pair.
+    """
+
+    def __init__(self, cache: "ResultCache", key: str, codec: str, index: dict):
+        self.cache = cache
+        self.key = key
+        self.codec = codec
+        self.index = index
+        self.entries = {}
+
+    def __getitem__(self, name):
+        if name not in self.entries:
+            item = self.index[name]
+            if item["fields"] is None:
+                self.entries[name] = item["value"]
+            else:
+                self.entries[name] = Entry(
+                    item["fields"],
+                    item["value"],
+                    partial(self.cache.load_shard, self.key, name, self.codec),
+                )
+        return self.entries[name]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class ResultCache(sqlite_store.Store):
+    """Packed parsed metrics in SQLite, with TTL and LRU eviction by size
+
+    Results are shared with new collections for the TTL after they are
+    collected, and kept for users viewing them until unused for the TTL.
+
+    Each pair is stored as a small index, with the node summaries, TopN and
+    the stats of every VIP, and one shard for the rest of each VIP.
+    """
+
+    def __init__(
+        self,
+        path: str = PATH,
+        ttl: int = TTL,
+        size_mb: int = SIZE_MB,
+        compression: str = COMPRESSION,
+    ):
+        super().__init__(path)
+        self.ttl = ttl
+        self.size_mb = size_mb
+        if compression not in packing.CODECS:
+            print(
+                f"Compression {compression} is not available,"
+                " results are stored uncompressed"
+            )
+            compression = COMPRESSION
+        self.compression = compression
+        with self.connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] < VERSION:
+                self.migrate(db)
+
+    def migrate(self, db: sqlite3.Connection):
+        """Create tables and drop ones from older versions, once per database
+
+        Args:
+            db (sqlite3.Connection): Database connection
+        """
+        # Whole results saved before pairs were split into shards
+        db.execute("DROP TABLE IF EXISTS results")
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS pairs (
+                key TEXT PRIMARY KEY,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL
+            )"""
+        )
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS shards (
+                key TEXT NOT NULL,
+                entry TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (key, entry)
+            )"""
+        )
+        db.execute(f"PRAGMA user_version = {VERSION}")
+
+    def load(self, key: str, shared: bool = True) -> ShardedResult:
+        """Get cached result
+
+        Only the pair index is read, shards are read as pages use them.
+
+        Args:
+            key (str): Cache key from result_key()
+            shared (bool, optional): Only return results collected within the
+            TTL, for reuse by a new collection. Set to False for a result a
+            user is already viewing. Defaults to True.
+
+        Returns:
+            ShardedResult: Parsed metrics, or None if missing or expired
+        """
+        oldest = time.time() - self.ttl if shared else 0
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT codec, data FROM pairs WHERE key = ? AND created >= ?",
+                (key, oldest),
+            ).fetchone()
+            if row:
+                db.execute(
+                    "UPDATE pairs SET accessed = ? WHERE key = ?", (time.time(), key)
+                )
+        if row is None:
+            return None
+        codec, data = row
+        return ShardedResult(
+            self, key, codec, packing.unpack_entry(memoryview(data), codec)
+        )
+
+    def load_shard(self, key: str, entry: str, codec: str) -> dict:
+        """Read fields of an entry that are not in the pair index
+
+        Args:
+            key (str): Cache key from result_key()
+            entry (str): Entry of parsed metrics, such as a VIP
+            codec (str): Compression of the result
+
+        Returns:
+            dict: Fields of the entry left out of the index
+
+        Raises:
+            ResultExpired: If the result was evicted after its index was read
+        """
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT data FROM shards WHERE key = ? AND entry = ?", (key, entry)
+            ).fetchone()
+            if row:
+                db.execute(
+                    "UPDATE pairs SET accessed = ? WHERE key = ?", (time.time(), key)
+                )
+        if row is None:
+            raise ResultExpired(f"{entry} was evicted from the result cache")
+        return packing.unpack_entry(memoryview(row[0]), codec)
+
+    def save(self, key: str, parsed_metrics: dict, progress=None):
+        """Add result to cache and evict expired or least recently used results
+
+        Args:
+            key (str): Cache key from result_key()
+            parsed_metrics (dict): Parsed metrics to cache
+            progress (function, optional): Callback for entries packed.
+            Defaults to None.
+        """
+        index = {}
+        shards = []
+        for done, (name, value) in enumerate(parsed_metrics.items()):
+            if progress:
+                progress(
+                    {
+                        "phase": "saving",
+                        "done": done,
+                        "total": len(parsed_metrics),
+                        "unit": "entries",
+                    }
+                )
+            if type(value) is dict:
+                rest = {
+                    field: item
+                    for field, item in value.items()
+                    if field not in INDEX_FIELDS
+                }
+                data = packing.pack_entry(rest, self.compression)
+                if len(data) > INDEX_BYTES:
+                    shards.append((key, name, data))
+                    index[name] = {
+                        "fields": list(value),
+                        "value": {
+                            field: item
+                            for field, item in value.items()
+                            if field in INDEX_FIELDS
+                        },
+                    }
+                    continue
+            index[name] = {"fields": None, "value": value}
+        data = packing.pack_entry(index, self.compression)
+        size = len(data) + sum(len(shard[2]) for shard in shards)
+        now = time.time()
+        with self.connect() as db:
+            db.execute("DELETE FROM shards WHERE key = ?", (key,))
+            db.execute(
+                "INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?, ?)",
+                (key, now, now, size, self.compression, data),
+            )
+            db.executemany("INSERT INTO shards VALUES (?, ?, ?)", shards)
+            total = 0
+            evict = []
+            for old_key, accessed, size in db.execute(
+                "SELECT key, accessed, size FROM pairs ORDER BY accessed DESC"
+            ).fetchall():
+                if accessed < now - self.ttl:
+                    evict.append((old_key,))
+                    continue
+                total += size
+                if total > self.size_mb * 1024 * 1024 and old_key != key:
+                    evict.append((old_key,))
+            db.executemany("DELETE FROM pairs WHERE key = ?", evict)
+            db.executemany("DELETE FROM shards WHERE key = ?", evict)
+
+
+def open_cache(config: dict) -> ResultCache:
+    """Open result cache using settings from config
+
+    Args:
+        config (dict): Application settings
+
+    Returns:
+        ResultCache: Shared result cache
+    """
+    return sqlite_store.open_store(ResultCache, PATH, config, RESULT_OPTIONS)
@@ -0,0 +1,283 @@
+# spans.py
+
+# Named timings and sizes kept as histograms, for /metrics and run summaries
+
+import atexit
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, Timer
+
+import sqlite_store
+
+# Prefix for metric names in Prometheus output
+PREFIX = "report_aux_"
+# Database combining histograms of all web workers, and seconds between writes
+PATH = "cache/metrics.sqlite"
+FLUSH_INTERVAL = 5
+
+# Help text and histogram bucket bounds for each metric
+METRICS = {
+    "span_seconds": (
+        "Seconds spent in each step of collecting and reporting",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+    ),
+    "measurements_bytes": (
+        "Size of Measurements API response bodies",
+        (1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+    ),
+    "measurements_points": (
+        "Values in Measurements API responses",
+        (1e2, 1e3, 1e4, 1e5, 1e6, 1e7),
+    ),
+}
+
+# Bucket counts, count and sum for each metric and span name in this process
+histograms = {}
+histograms_lock = Lock()
+
+# Database this process writes its histograms to, set by share()
+shared_path = None
+# Identifies this process in the database, as process IDs are reused
+process = f"{os.getpid()}-{time.time()}"
+flush_timer = None
+# Keeps an older copy of the histograms from being written after a newer one
+flush_lock = Lock()
+
+
+def share(path: str = PATH):
+    """Combine histograms with other processes sharing the database
+
+    Each process writes its own totals, which only grow, so combined
+    counts never go backwards whichever process is scraped.
+
+    Args:
+        path (str, optional): Database file. Defaults to PATH.
+    """
+    global shared_path
+    sqlite_store.create_folder(path)
+    with sqlite_store.connect(path) as db:
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS histograms (
+                process TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                name TEXT NOT NULL,
+                buckets TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                PRIMARY KEY (process, metric, name)
+            )"""
+        )
+    shared_path = path
+    atexit.register(flush)
+
+
+def flush():
+    """Write histograms of this process to the shared database"""
+    global flush_timer
+    if shared_path is None:
+        return
+    with flush_lock:
+        with histograms_lock:
+            flush_timer = None
+            rows = [
+                (
+                    process,
+                    metric,
+                    name,
+                    json.dumps(histogram["buckets"]),
+                    histogram["count"],
+                    histogram["sum"],
+                )
+                for (metric, name), histogram in histograms.items()
+            ]
+        try:
+            with sqlite_store.connect(shared_path) as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO histograms VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as e:
+            print(f"Unable to save metrics: {e}")
+
+
+def observe(metric: str, name: str, value: float):
+    """Add a value to a histogram
+
+    Args:
+        metric (str): Metric from METRICS
+        name (str): Span name
+        value (float): Value to add
+    """
+    bounds = METRICS[metric][1]
+    with histograms_lock:
+        histogram = histograms.setdefault(
+            (metric, name), {"buckets": [0] * len(bounds), "count": 0, "sum": 0.0}
+        )
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["count"] += 1
+        histogram["sum"] += value
+        if shared_path is not None and flush_timer is None:
+            start_flush()
+
+
+def start_flush():
+    """Schedule a write of this process's histograms, called holding the lock"""
+    global flush_timer
+    flush_timer = Timer(FLUSH_INTERVAL, flush)
+    flush_timer.daemon = True
+    flush_timer.start()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of code as a named span
+
+    Args:
+        name (str): Span name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("span_seconds", name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorate a function so each call is timed as a named span
+
+    Args:
+        name (str): Span name
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> dict:
+    """Copy current counts and sums, to compare with later
+
+    Returns:
+        dict: Count and sum for each metric and span name
+    """
+    with histograms_lock:
+        return {
+            key: (histogram["count"], histogram["sum"])
+            for key, histogram in histograms.items()
+        }
+
+
+def summary(since: dict = None) -> dict:
+    """Summarize spans recorded in this process
+
+    Args:
+        since (dict, optional): Earlier snapshot() to subtract.
+        Defaults to None, for everything recorded.
+
+    Returns:
+        dict: Count and sum for each span name, by metric
+    """
+    since = since or {}
+    result = {}
+    for (metric, name), (count, total) in snapshot().items():
+        before = since.get((metric, name), (0, 0.0))
+        if count > before[0]:
+            result.setdefault(metric, {})[name] = {
+                "count": count - before[0],
+                "sum": total - before[1],
+            }
+    return result
+
+
+def merge(summaries: list) -> dict:
+    """Combine summaries from several runs or processes
+
+    Args:
+        summaries (list): Output from summary()
+
+    Returns:
+        dict: Total count and sum for each span name, by metric
+    """
+    result = {}
+    for spans in summaries:
+        for metric, names in spans.items():
+            for name, values in names.items():
+                total = result.setdefault(metric, {}).setdefault(
+                    name, {"count": 0, "sum": 0.0}
+                )
+                total["count"] += values["count"]
+                total["sum"] += values["sum"]
+    return result
+
+
+def combined() -> dict:
+    """Add up histograms of all processes sharing the database
+
+    Returns:
+        dict: Bucket counts, count and sum for each metric and span name
+    """
+    flush()
+    current = {}
+    with sqlite_store.connect(shared_path) as db:
+        rows = db.execute(
+            "SELECT metric, name, buckets, count, sum FROM histograms"
+        ).fetchall()
+    for metric, name, buckets, count, total in rows:
+        if metric not in METRICS:
+            continue
+        histogram = current.setdefault(
+            (metric, name),
+            {"buckets": [0] * len(METRICS[metric][1]), "count": 0, "sum": 0.0},
+        )
+        for i, bucket in enumerate(json.loads(buckets)[: len(histogram["buckets"])]):
+            histogram["buckets"][i] += bucket
+        histogram["count"] += count
+        histogram["sum"] += total
+    return current
+
+
+def prometheus() -> str:
+    """Format histograms in the Prometheus text exposition format
+
+    Returns:
+        str: Metrics text for a /metrics endpoint, for all processes
+        sharing the database if share() was called
+    """
+    if shared_path is not None:
+        current = combined()
+    else:
+        with histograms_lock:
+            current = {
+                key: dict(histogram, buckets=list(histogram["buckets"]))
+                for key, histogram in histograms.items()
+            }
+    lines = []
+    for metric, (description, bounds) in METRICS.items():
+        full_name = PREFIX + metric
+        lines.append(f"# HELP {full_name} {description}")
+        lines.append(f"# TYPE {full_name} histogram")
+        for (key, name), histogram in sorted(current.items()):
+            if key != metric:
+                continue
+            for bound, count in zip(bounds, histogram["buckets"]):
+                lines.append(
+                    f'{full_name}_bucket{{span="{name}",le="{bound:g}"}} {count}'
+                )
+            lines.append(
+                f'{full_name}_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}'
+            )
+            lines.append(f'{full_name}_sum{{span="{name}"}} {histogram["sum"]}')
+            lines.append(f'{full_name}_count{{span="{name}"}} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,91 @@
+# sqlite_store.py
+
+# SQLite databases shared by web workers and export processes
+
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# Seconds to wait for another process to finish writing
+TIMEOUT = 60
+
+
+def create_folder(path: str):
+    """Create the folder of a database file, if missing
+
+    Args:
+        path (str): Database file
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+@contextmanager
+def connect(path: str, pragmas: list = ()) -> sqlite3.Connection:
+    """Open connection to a database, committing and closing on exit
+
+    Args:
+        path (str): Database file
+        pragmas (list, optional): PRAGMA settings for the connection, besides
+        WAL mode. Defaults to none.
+
+    Yields:
+        sqlite3.Connection: Database connection
+    """
+    db = sqlite3.connect(path, timeout=TIMEOUT)
+    try:
+        # Before WAL mode, which creates a new database, as some settings
+        # such as auto_vacuum only apply to databases not yet created
+        for pragma in pragmas:
+            db.execute(f"PRAGMA {pragma}")
+        db.execute("PRAGMA journal_mode=WAL")
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+class Store:
+    """Data kept in one SQLite database, connected to for each use
+
+    Subclasses list PRAGMA settings for their connections in PRAGMAS.
+    """
+
+    PRAGMAS = []
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        create_folder(path)
+
+    def connect(self):
+        """Open connection to the database, committing and closing on exit
+
+        Returns:
+            Context manager yielding a sqlite3.Connection
+        """
+        return connect(self.path, self.PRAGMAS)
+
+
+def open_store(store: type, path: str, config: dict, options: dict, enable=None):
+    """Open a store with its optional settings from config
+
+    Args:
+        store (type): Store class, taking the path and then each setting
+        in the order of options
+        path (str): Database file
+        config (dict): Application settings
+        options (dict): Default value for each optional setting
+        enable (str, optional): Setting that disables the store when 0 or
+        less. Defaults to None.
+
+    Returns:
+        Store: Store shared by all workers, or None if disabled
+    """
+    # ra_processing imports modules built on this one
+    import ra_processing
+
+    settings = dict(options)
+    settings.update(ra_processing.config_options(config, options))
+    if enable and settings[enable] <= 0:
+        return None
+    return store(path, *settings.values())
@@ -0,0 +1,595 @@
+# timeseries.py
+
+# Columnar storage and aggregation of collected metrics
+
+import time
+
+import numpy as np
+
+HOUR = 3600000
+DAY = HOUR * 24
+# Buckets for each hour of each day of the week
+BUCKETS = 7 * 24
+
+
+def local_calendar(timestamps: np.ndarray) -> tuple:
+    """Map timestamps to local day of week and hour of day
+
+    Matches datetime.fromtimestamp(), including DST changes, while only
+    looking up the UTC offset once per distinct hour.
+
+    Args:
+        timestamps (np.ndarray): Epoch timestamps in milliseconds
+
+    Returns:
+        tuple: Arrays of day of week (Monday is 0) and hour of day
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    hours, inverse = np.unique(timestamps // HOUR, return_inverse=True)
+    offsets = {}
+    for hour in set(hours.tolist()) | set((hours + 1).tolist()):
+        offsets[hour] = time.localtime(hour * 3600).tm_gmtoff * 1000
+    start = np.array([offsets[hour] for hour in hours.tolist()], dtype=np.int64)
+    end = np.array([offsets[hour + 1] for hour in hours.tolist()], dtype=np.int64)
+    local = timestamps + start[inverse]
+
+    # Offset changes inside an hour need a lookup per timestamp
+    changed = (start != end)[inverse]
+    if changed.any():
+        local[changed] = [
+            ts + time.localtime(ts // 1000).tm_gmtoff * 1000
+            for ts in timestamps[changed].tolist()
+        ]
+    day = (local // DAY + 3) % 7
+    hour = (local // HOUR) % 24
+    return day, hour
+
+
+def to_list(values: np.ndarray) -> list:
+    """Convert array to list of floats, with None for NaN
+
+    Args:
+        values (np.ndarray): Array of float values
+
+    Returns:
+        list: Values as Python floats or None
+    """
+    converted = values.astype(object)
+    converted[np.isnan(values)] = None
+    return converted.tolist()
+
+
+def to_array(values: list) -> np.ndarray:
+    """Convert Measurements API values to a float64 array
+
+    Args:
+        values (list): Values from a response column, with "NaN" for gaps
+
+    Returns:
+        np.ndarray: Values with NaN for gaps
+    """
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array(
+            [np.nan if value is None else value for value in values], dtype=np.float64
+        )
+
+
+def summary_table(values: np.ndarray, metrics: list) -> dict:
+    """Calculate Min, Max, Average and Total of each row
+
+    Args:
+        values (np.ndarray): Values with one row per metric, NaN for gaps
+        metrics (list): Metric name of each row
+
+    Returns:
+        dict: Summary statistics for each metric, 0 for rows without values
+    """
+    if not metrics:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        # Reshape cannot infer the width of an empty array
+        values = np.empty((len(metrics), 0))
+    values = values.reshape(len(metrics), -1)
+    count = (~np.isnan(values)).sum(1)
+    empty = count == 0
+    total = np.nansum(values, axis=1)
+    columns = {
+        "Min": np.fmin.reduce(values, axis=1, initial=np.inf),
+        "Max": np.fmax.reduce(values, axis=1, initial=-np.inf),
+        "Average": total / np.maximum(count, 1),
+        "Total": total,
+    }
+    for name in columns:
+        columns[name] = np.where(empty, 0.0, columns[name]).tolist()
+    return {
+        metric: {name: columns[name][row] for name in columns}
+        for row, metric in enumerate(metrics)
+    }
+
+
+def merged_m2(
+    count: np.ndarray,
+    total: np.ndarray,
+    m2: np.ndarray,
+    other_count: np.ndarray,
+    other_total: np.ndarray,
+    other_m2: np.ndarray,
+) -> np.ndarray:
+    """Combine sums of squared deviations from two sets of values
+
+    Args:
+        count (np.ndarray): Count of values in first set
+        total (np.ndarray): Sum of values in first set
+        m2 (np.ndarray): Sum of squared deviations in first set
+        other_count (np.ndarray): Count of values in second set
+        other_total (np.ndarray): Sum of values in second set
+        other_m2 (np.ndarray): Sum of squared deviations in second set
+
+    Returns:
+        np.ndarray: Sum of squared deviations for both sets together
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = other_total / other_count - total / count
+        extra = delta * delta * count * other_count / (count + other_count)
+    return m2 + other_m2 + np.where((count > 0) & (other_count > 0), extra, 0.0)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Pick points that keep the shape of a line, using Largest-Triangle-Three-Buckets
+
+    The first and last points are kept. Points between them are split into
+    equal buckets, and from each bucket the point forming the largest
+    triangle with the point kept before it and the average of the next
+    bucket is kept.
+
+    Args:
+        x (np.ndarray): Sorted X values
+        y (np.ndarray): Y values
+        points (int): Most points to keep, at least 3
+
+    Returns:
+        np.ndarray: Indexes of points kept, or all if there are no more than points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if points < 3 or len(x) <= points:
+        return np.arange(len(x))
+    edges = np.linspace(1, len(x) - 1, points - 1).astype(np.int64)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = len(x) - 1
+    kept = 0
+    for bucket in range(0, points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end : edges[bucket + 2]].mean()
+            next_y = y[end : edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs(
+            (x[kept] - next_x) * (y[start:end] - y[kept])
+            - (x[kept] - x[start:end]) * (next_y - y[kept])
+        )
+        kept = start + int(area.argmax())
+        keep[bucket + 1] = kept
+    return keep
+
+
+class Accumulator:
+    """Running count, sum, min, max and M2 of values in buckets
+
+    Memory depends only on the number of metrics and buckets, and
+    accumulators built from separate chunks of data can be merged exactly.
+    """
+
+    def __init__(self, metric_count: int, bucket_count: int = BUCKETS) -> None:
+        shape = (metric_count, bucket_count)
+        self.seen = np.zeros(shape, dtype=np.int64)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.m2 = np.zeros(shape)
+
+    def add(self, rows: np.ndarray, buckets: np.ndarray, values: np.ndarray):
+        """Add a block of values
+
+        Args:
+            rows (np.ndarray): Metric index of each value row
+            buckets (np.ndarray): Bucket number of each value column
+            values (np.ndarray): Values with NaN for gaps
+        """
+        if not len(buckets):
+            return
+        order = np.argsort(buckets, kind="stable")
+        ordered = buckets[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        lengths = np.diff(np.r_[starts, len(ordered)])
+        values = values[:, order]
+        mask = ~np.isnan(values)
+
+        count = np.add.reduceat(mask.astype(np.int64), starts, axis=1)
+        total = np.add.reduceat(np.where(mask, values, 0.0), starts, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.repeat(total / count, lengths, axis=1)
+        deviation = np.where(mask, values - mean, 0.0)
+        m2 = np.add.reduceat(deviation * deviation, starts, axis=1)
+        # Buckets with only gaps give NaN, which fmin/fmax then ignore
+        minimum = np.fmin.reduceat(values, starts, axis=1)
+        maximum = np.fmax.reduceat(values, starts, axis=1)
+
+        index = (rows[:, None], ordered[starts][None, :])
+        self.m2[index] = merged_m2(
+            self.count[index], self.total[index], self.m2[index], count, total, m2
+        )
+        self.seen[index] += lengths
+        self.count[index] += count
+        self.total[index] += total
+        self.minimum[index] = np.fmin(self.minimum[index], minimum)
+        self.maximum[index] = np.fmax(self.maximum[index], maximum)
+
+    def merge(self, other: "Accumulator"):
+        """Add values from another accumulator with the same buckets
+
+        Args:
+            other (Accumulator): Accumulator to include
+        """
+        self.m2 = merged_m2(
+            self.count, self.total, self.m2, other.count, other.total, other.m2
+        )
+        self.seen += other.seen
+        self.count += other.count
+        self.total += other.total
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+
+    def combine(self, groups: np.ndarray, group_count: int) -> "Accumulator":
+        """Merge buckets into larger groups
+
+        Args:
+            groups (np.ndarray): Group number of each bucket
+            group_count (int): Number of groups
+
+        Returns:
+            Accumulator: Accumulator with one bucket per group
+        """
+        combined = Accumulator(len(self.count), group_count)
+        for group in range(0, group_count):
+            members = np.flatnonzero(groups == group)
+            count = self.count[:, members]
+            total = self.total[:, members]
+            counts = count.sum(1)
+            totals = total.sum(1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                delta = total / count - (totals / counts)[:, None]
+            spread = np.where(count > 0, count * delta * delta, 0.0).sum(1)
+            combined.m2[:, group] = self.m2[:, members].sum(1) + spread
+            combined.seen[:, group] = self.seen[:, members].sum(1)
+            combined.count[:, group] = counts
+            combined.total[:, group] = totals
+            combined.minimum[:, group] = self.minimum[:, members].min(1)
+            combined.maximum[:, group] = self.maximum[:, members].max(1)
+        return combined
+
+    def means(self, metrics: list, bucket: int) -> dict:
+        """Average each metric within a bucket
+
+        Args:
+            metrics (list): Metric name of each row
+            bucket (int): Bucket number
+
+        Returns:
+            dict: Average for each metric received, None if all values were gaps
+        """
+        means = {}
+        for row, metric in enumerate(metrics):
+            if self.seen[row, bucket]:
+                count = self.count[row, bucket]
+                means[metric] = self.total[row, bucket] / count if count else None
+        return means
+
+    def variance(self) -> np.ndarray:
+        """Population variance of each metric in each bucket
+
+        Returns:
+            np.ndarray: Variance, NaN for buckets without values
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.m2 / self.count
+
+
+class Totals:
+    """Per-timestamp sums and counts for one label"""
+
+    def __init__(self, metric_count: int, ts_count: int) -> None:
+        self.sums = np.zeros((metric_count, ts_count))
+        self.valid = np.zeros((metric_count, ts_count), dtype=np.int64)
+        self.seen = np.zeros((metric_count, ts_count), dtype=np.int64)
+
+    def add(self, rows: np.ndarray, positions: np.ndarray, values: np.ndarray):
+        """Add a block of values to the totals
+
+        Args:
+            rows (np.ndarray): Metric index of each value row
+            positions (np.ndarray): Timestamp index of each value column
+            values (np.ndarray): Values with NaN for gaps
+        """
+        mask = ~np.isnan(values)
+        index = (rows[:, None], positions[None, :])
+        if np.all(positions[1:] > positions[:-1]):
+            self.sums[index] += np.where(mask, values, 0.0)
+            self.valid[index] += mask
+            self.seen[index] += 1
+        else:
+            # Repeated timestamps need unbuffered adds
+            np.add.at(self.sums, index, np.where(mask, values, 0.0))
+            np.add.at(self.valid, index, mask)
+            np.add.at(self.seen, index, 1)
+
+    def merge(self, other: "Totals"):
+        """Add totals from another label
+
+        Args:
+            other (Totals): Totals to include
+        """
+        self.sums += other.sums
+        self.valid += other.valid
+        self.seen += other.seen
+
+
+class MetricStore:
+    """Columnar store for Measurements API responses
+
+    Each response is kept as an int64 timestamp vector, shared between all
+    responses covering the same times, and a float64 matrix with one row per
+    metric and NaN marking missing values.
+    """
+
+    def __init__(self, metrics: list = []) -> None:
+        self.metrics = list(metrics)
+        self.interfaces = {}
+        self.timestamps = {}
+
+    def metric_index(self, metric: str) -> int:
+        """Get row number for metric, adding it if unknown
+
+        Args:
+            metric (str): Metric name
+
+        Returns:
+            int: Row number for metric
+        """
+        if metric not in self.metrics:
+            self.metrics.append(metric)
+        return self.metrics.index(metric)
+
+    def add_interface(self, interface: str):
+        """Register interface so it keeps its collection order
+
+        Args:
+            interface (str): Resource ID of interface
+        """
+        if interface not in self.interfaces:
+            self.interfaces[interface] = {"label": None, "chunks": []}
+
+    def shared_timestamps(self, timestamps: np.ndarray) -> np.ndarray:
+        """Reuse an identical timestamp vector if one is already stored
+
+        Args:
+            timestamps (np.ndarray): Timestamps from a response
+
+        Returns:
+            np.ndarray: Stored timestamp vector
+        """
+        key = (len(timestamps), int(timestamps[0]), int(timestamps[-1]))
+        for stored in self.timestamps.setdefault(key, []):
+            if np.array_equal(stored, timestamps):
+                return stored
+        self.timestamps[key].append(timestamps)
+        return timestamps
+
+    def add_response(self, interface: str, metric_data: dict):
+        """Store Measurements API response for an interface
+
+        Args:
+            interface (str): Resource ID of interface
+            metric_data (dict): Raw API response
+        """
+        self.add_interface(interface)
+        columns = metric_data.get("columns") or []
+        timestamps = metric_data.get("timestamps")
+        if timestamps is None or not len(timestamps) or not columns:
+            return
+        resources = metric_data["metadata"]["resources"]
+        label = resources[0]["label"]
+        for resource in resources:
+            if resource.get("id") == interface:
+                label = resource["label"]
+        self.add_values(
+            interface,
+            label,
+            np.asarray(timestamps, dtype=np.int64),
+            metric_data["labels"][: len(columns)],
+            np.vstack([to_array(column["values"]) for column in columns]),
+        )
+
+    def add_values(
+        self,
+        interface: str,
+        label: str,
+        timestamps: np.ndarray,
+        metrics: list,
+        values: np.ndarray,
+    ):
+        """Store a block of values for an interface
+
+        Args:
+            interface (str): Resource ID of interface
+            label (str): VIP label of interface
+            timestamps (np.ndarray): Timestamps in milliseconds
+            metrics (list): Metric name of each value row
+            values (np.ndarray): Values with one row per metric
+        """
+        self.add_interface(interface)
+        self.interfaces[interface]["label"] = label
+        self.interfaces[interface]["chunks"].append(
+            (
+                self.shared_timestamps(timestamps),
+                np.array([self.metric_index(metric) for metric in metrics]),
+                values,
+            )
+        )
+
+    def build(self, stats: list = None, progress=None) -> dict:
+        """Build parsed metrics for all interfaces, VIP labels and the device
+
+        Args:
+            stats (list, optional): Metrics to add summary statistics for on
+            each VIP label. Defaults to None.
+            progress (function, optional): Called with no arguments after each
+            interface. Defaults to None.
+
+        Returns:
+            dict: Interfaces and labels in collection order, plus node[device]
+        """
+        vectors = [ts for stored in self.timestamps.values() for ts in stored]
+        all_ts = np.unique(np.concatenate(vectors)) if vectors else np.array([])
+        day, hour = local_calendar(all_ts)
+        positions = {id(ts): np.searchsorted(all_ts, ts) for ts in vectors}
+        calendar = {
+            "ts": all_ts.tolist(),
+            "day": day,
+            "bucket": day * 24 + hour,
+        }
+
+        by_label = {}
+        for interface, entry in self.interfaces.items():
+            if entry["label"] is not None:
+                by_label.setdefault(entry["label"], []).append(entry)
+
+        parsed_metrics = {}
+        device = None
+        for interface, entry in self.interfaces.items():
+            if progress:
+                progress()
+            parsed_metrics[interface] = self.interface_view(entry, positions, calendar)
+            label = entry["label"]
+            if label is None or label in parsed_metrics:
+                continue
+            totals = Totals(len(self.metrics), len(all_ts))
+            buckets = Accumulator(len(self.metrics))
+            for member in by_label[label]:
+                for timestamps, rows, values in member["chunks"]:
+                    position = positions[id(timestamps)]
+                    totals.add(rows, position, values)
+                    buckets.add(rows, calendar["bucket"][position], values)
+            parsed_metrics[label] = self.label_view(totals, buckets, calendar)
+            if stats is not None:
+                parsed_metrics[label]["stats"] = self.label_stats(totals, stats)
+            if device is None:
+                device = (totals, buckets)
+            else:
+                device[0].merge(totals)
+                device[1].merge(buckets)
+        if device is not None:
+            parsed_metrics["node[device]"] = self.label_view(*device, calendar)
+        return parsed_metrics
+
+    def interface_view(self, entry: dict, positions: dict, calendar: dict) -> dict:
+        """Build raw time series for a single interface
+
+        Args:
+            entry (dict): Stored interface data
+            positions (dict): Index into calendar for each timestamp vector
+            calendar (dict): Timestamps and day of week for all data
+
+        Returns:
+            dict: Raw values keyed by timestamp
+        """
+        view = {"ts": {}}
+        if entry["label"] is not None:
+            view["label"] = entry["label"]
+        for timestamps, rows, values in entry["chunks"]:
+            names = [self.metrics[row] for row in rows]
+            days = calendar["day"][positions[id(timestamps)]].tolist()
+            columns = [to_list(column) for column in values]
+            for ts, day, row in zip(timestamps.tolist(), days, zip(*columns)):
+                point = dict(zip(names, row))
+                point["timestamp"] = ts
+                point["day"] = day
+                if ts in view["ts"]:
+                    view["ts"][ts].update(point)
+                else:
+                    view["ts"][ts] = point
+        return view
+
+    def label_view(self, totals: Totals, buckets: Accumulator, calendar: dict) -> dict:
+        """Build averaged time series and histograms for a label
+
+        Args:
+            totals (Totals): Sums and counts for the label
+            buckets (Accumulator): Values for the label by day and hour
+            calendar (dict): Timestamps for all data
+
+        Returns:
+            dict: Averaged time series, summary, day_of_week and hour_of_day
+        """
+        present = totals.seen.any(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = totals.sums / totals.valid
+
+        # Timestamps in chronological order, skipping metrics never received
+        index = np.flatnonzero(present)
+        seen = totals.seen[:, index] > 0
+        columns = [to_list(row) for row in means[:, index]]
+        keys = [calendar["ts"][i] for i in index.tolist()]
+        view = {"ts": {}, "summary": {}}
+        if seen.all():
+            for ts, row in zip(keys, zip(*columns)):
+                view["ts"][ts] = dict(zip(self.metrics, row))
+        else:
+            received = [np.flatnonzero(column).tolist() for column in seen.T]
+            for i, ts in enumerate(keys):
+                view["ts"][ts] = {
+                    self.metrics[row]: columns[row][i] for row in received[i]
+                }
+
+        # Day totals, hours across all days and the summary are merged buckets
+        slots = np.arange(0, BUCKETS)
+        days = buckets.combine(slots // 24, 7)
+        hours = buckets.combine(slots % 24, 24)
+        overall = buckets.combine(np.zeros(BUCKETS, dtype=np.int64), 1)
+
+        view["day_of_week"] = {}
+        for day in range(0, 7):
+            view["day_of_week"][day] = {"total": days.means(self.metrics, day)}
+            for hour in range(0, 24):
+                view["day_of_week"][day][hour] = buckets.means(
+                    self.metrics, day * 24 + hour
+                )
+        view["hour_of_day"] = {}
+        for hour in range(0, 24):
+            view["hour_of_day"][hour] = hours.means(self.metrics, hour)
+        view["summary"] = overall.means(self.metrics, 0)
+        return view
+
+    def label_stats(self, totals: Totals, metrics: list) -> dict:
+        """Summarize averaged time series of a label
+
+        Args:
+            totals (Totals): Sums and counts for the label
+            metrics (list): Metrics to summarize
+
+        Returns:
+            dict: Min, Max, Average and Total for each metric
+        """
+        values = np.full((len(metrics), totals.sums.shape[1]), np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for position, metric in enumerate(metrics):
+                if metric in self.metrics:
+                    row = self.metrics.index(metric)
+                    values[position] = totals.sums[row] / totals.valid[row]
+        return summary_table(values, metrics)
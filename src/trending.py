@@ -5,11 +5,37 @@
 
 from datetime import datetime
 from models import Day
-from ra_processing import average_metrics
+from ra_processing import average_metrics, config_options
 
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+import spans
+import timeseries
+
+# Most points drawn for each line in browser graphs
+GRAPH_POINTS = 2000
+# Lines with more points collected are drawn with WebGL, even once downsampled
+WEBGL_POINTS = 5000
+
+# Settings from config.json used by graph_options()
+GRAPH_OPTIONS = {
+    "graph_points": GRAPH_POINTS,
+}
+
+
+def graph_options(config: dict) -> dict:
+    """Read optional graph settings from config
+
+    Args:
+        config (dict): Application settings
+
+    Returns:
+        dict: Keyword arguments for downsample_lines()
+    """
+    return config_options(config, GRAPH_OPTIONS)
+
 
 def byte_metrics(metrics: list) -> list:
     """Filter all metrics to only include those related to bytes
@@ -181,6 +207,38 @@ def time_lines(parsed_metrics: dict, interface: str, label: list) -> dict:
     return stats_out, stats_in
 
 
+def downsample_lines(
+    stats_out: dict, stats_in: dict, graph_points: int = GRAPH_POINTS
+) -> tuple:
+    """Reduce line graph data to the points needed to draw its shape
+
+    Args:
+        stats_out (dict): Output data from time_lines()
+        stats_in (dict): Output data from time_lines()
+        graph_points (int, optional): Most points kept for each line, 0 for all.
+        Defaults to GRAPH_POINTS.
+
+    Returns:
+        tuple: Output and input data for get_trend_line(), with the number of
+        points collected for reduced lines
+    """
+    lines = []
+    for stats in (stats_out, stats_in):
+        if not graph_points or len(stats["x"]) <= graph_points:
+            lines.append(stats)
+            continue
+        x = np.array(stats["x"], dtype="datetime64[ms]").astype(np.int64)
+        keep = timeseries.lttb(x, stats["y"], graph_points).tolist()
+        lines.append(
+            {
+                "x": [stats["x"][i] for i in keep],
+                "y": [stats["y"][i] for i in keep],
+                "points": len(stats["x"]),
+            }
+        )
+    return tuple(lines)
+
+
 theme = {
     "out": "#204a87",
     "in": "#4e9a06",
@@ -190,6 +248,7 @@ theme = {
 }
 
 
+@spans.timed("figure")
 def get_trend_graph(trend: dict, margin: int = 80) -> px.scatter:
     """Generate Plotly time trend graph
 
@@ -252,23 +311,33 @@ def get_trend_graph(trend: dict, margin: int = 80) -> px.scatter:
     return fig
 
 
+@spans.timed("figure")
 def get_trend_line(
-    stats_out: dict, stats_in: dict, weekends: dict, margin: int = 80
+    stats_out: dict,
+    stats_in: dict,
+    weekends: dict,
+    margin: int = 80,
+    webgl: bool = True,
 ) -> go.Figure:
     """Generate Plotly line graph of raw traffic data
 
     Args:
-        stats_out (dict): Output data from time_lines()
-        stats_in (dict): Output data from time_lines()
+        stats_out (dict): Output data from time_lines() or downsample_lines()
+        stats_in (dict): Output data from time_lines() or downsample_lines()
         weekends (dict): Output from find_weekends()
         margin (int): Margin for the graph in pixels
+        webgl (bool, optional): Draw lines collected with over WEBGL_POINTS
+        with WebGL. Defaults to True.
 
     Returns:
         go.Figure: Line graph of traffic
     """
+    points = [stats.get("points", len(stats["x"])) for stats in (stats_out, stats_in)]
+    large = max(points) > WEBGL_POINTS
+    scatter = go.Scattergl if webgl and large else go.Scatter
     fig2 = go.Figure()
     fig2.add_trace(
-        go.Scatter(
+        scatter(
             x=stats_out["x"],
             y=stats_out["y"],
             mode="lines",
@@ -279,7 +348,7 @@ def get_trend_line(
         )
     )
     fig2.add_trace(
-        go.Scatter(
+        scatter(
             x=stats_in["x"],
             y=stats_in["y"],
             mode="lines",